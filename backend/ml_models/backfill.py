@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Backfill Waste Classification
+Re-classifies the stored images (e.g. uploads/) after a model change. Progress
+is checkpointed to a local state file so an interrupted run resumes where it
+stopped, and images already scored with the same model weights are skipped.
+
+The state file is an append-only JSON-lines journal with one entry per scored
+image; results are appended to a separate JSON-lines file as each batch
+finishes. Results are written before the journal, so a crash can at worst
+re-score (and re-emit) the last batch.
+"""
+
+import argparse
+import json
+import os
+import signal
+import sys
+import time
+
+from model_cache import weights_hash
+from profiling import add_profile_arguments, from_args as profiler_from_args
+from tiling import add_tiling_arguments, tiling_options
+from waste_classifier import apply_confidence_threshold, classify_images, load_model
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.webp'}
+
+
+def iter_images(root):
+    """Yield (relative path, absolute path, stat) for images under root in a stable order."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if os.path.splitext(filename)[1].lower() not in IMAGE_EXTENSIONS:
+                continue
+            path = os.path.join(dirpath, filename)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            yield os.path.relpath(path, root), path, stat
+
+
+def load_state(state_path):
+    """Read the journal into {relative path: entry}; later entries win."""
+    scored = {}
+    if not os.path.exists(state_path):
+        return scored
+    with open(state_path, 'r') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # Torn final line from an interrupted write
+                continue
+            scored[entry['image']] = entry
+    return scored
+
+
+def is_current(entry, model_hash, stat, tiling=None):
+    """True if the image was scored successfully by these weights and tiling, and is unchanged."""
+    return (
+        entry is not None
+        and entry.get('success', True)
+        and entry.get('model_hash') == model_hash
+        and entry.get('tiling') == tiling
+        and entry.get('mtime_ns') == stat.st_mtime_ns
+        and entry.get('size') == stat.st_size
+    )
+
+
+def append_lines(path, records):
+    """Append JSON lines and fsync so the batch survives a crash."""
+    with open(path, 'a') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class Throttle:
+    """Keeps the long-run rate at or below max_rate images per second."""
+
+    def __init__(self, max_rate):
+        self.max_rate = max_rate
+        self.started_at = time.monotonic()
+        self.count = 0
+
+    def wait(self, processed):
+        self.count += processed
+        if not self.max_rate:
+            return
+        ahead = self.count / self.max_rate - (time.monotonic() - self.started_at)
+        if ahead > 0:
+            time.sleep(ahead)
+
+
+def run_backfill(args, model, model_hash, profiler, tiling=None):
+    import cv2
+
+    scored = load_state(args.state)
+    stop_requested = []
+
+    def request_stop(signum, frame):
+        # Finish and checkpoint the current batch, then exit
+        stop_requested.append(signum)
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    throttle = Throttle(args.max_rate)
+    totals = {'scanned': 0, 'skipped': 0, 'processed': 0, 'failed': 0}
+
+    def flush(batch):
+        images = [cv2.imread(path) for _, path, _ in batch]
+        results = classify_images(images, model, profiler,
+                                  sources=[path for _, path, _ in batch], tiling=tiling)
+
+        result_records = []
+        state_records = []
+        for (relpath, _, stat), result in zip(batch, results):
+            apply_confidence_threshold(result, args.confidence)
+            result_records.append({
+                'image': relpath,
+                'model': args.model,
+                'model_hash': model_hash,
+                **result
+            })
+            state_records.append({
+                'image': relpath,
+                'model_hash': model_hash,
+                'mtime_ns': stat.st_mtime_ns,
+                'size': stat.st_size,
+                'tiling': tiling,
+                'success': result['success']
+            })
+            totals['processed' if result['success'] else 'failed'] += 1
+
+        append_lines(args.output, result_records)
+        append_lines(args.state, state_records)
+        throttle.wait(len(batch))
+
+    batch = []
+    for relpath, path, stat in iter_images(args.root):
+        if stop_requested:
+            break
+        if args.limit and totals['processed'] + totals['failed'] + len(batch) >= args.limit:
+            break
+
+        totals['scanned'] += 1
+        if is_current(scored.get(relpath), model_hash, stat, tiling):
+            totals['skipped'] += 1
+            continue
+
+        batch.append((relpath, path, stat))
+        if len(batch) >= args.batch_size:
+            flush(batch)
+            batch = []
+
+    if batch:
+        flush(batch)
+
+    return {
+        'success': True,
+        'interrupted': bool(stop_requested),
+        'model': args.model,
+        'model_hash': model_hash,
+        'state_file': args.state,
+        'output_file': args.output,
+        **totals
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backfill Waste Classification for stored images')
+    parser.add_argument('--root', default='uploads', help='Image store directory to walk')
+    parser.add_argument('--model', default='yolov8n.pt', help='Path to YOLOv8 model')
+    parser.add_argument('--confidence', type=float, default=0.5, help='Confidence threshold')
+    parser.add_argument('--batch-size', type=int, default=32, help='Images per inference batch')
+    parser.add_argument('--state', default='backfill_state.jsonl', help='Checkpoint journal path')
+    parser.add_argument('--output', default='backfill_results.jsonl', help='JSON-lines results path')
+    parser.add_argument('--max-rate', type=float, default=0,
+                        help='Max images per second (0 = unthrottled)')
+    parser.add_argument('--nice', type=int, default=0,
+                        help='Lower CPU priority by this niceness to run beside live traffic')
+    parser.add_argument('--limit', type=int, default=0, help='Stop after scoring this many images')
+    add_tiling_arguments(parser)
+    add_profile_arguments(parser)
+
+    args = parser.parse_args()
+
+    try:
+        tiling = tiling_options(args)
+    except ValueError as e:
+        print(json.dumps({
+            'success': False,
+            'error': f'Invalid tiling options: {str(e)}'
+        }))
+        sys.exit(1)
+
+    if not os.path.isdir(args.root):
+        print(json.dumps({
+            'success': False,
+            'error': f'Image directory not found: {args.root}'
+        }))
+        sys.exit(1)
+
+    if args.batch_size < 1:
+        print(json.dumps({
+            'success': False,
+            'error': 'Batch size must be at least 1'
+        }))
+        sys.exit(1)
+
+    if args.nice:
+        os.nice(args.nice)
+
+    profiler = profiler_from_args(args, 'backfill',
+                                  import_modules=('ultralytics', 'cv2', 'numpy'))
+    with profiler.session():
+        # Load model
+        model = load_model(args.model)
+        if model is None:
+            print(json.dumps({
+                'success': False,
+                'error': 'Failed to load YOLOv8 model'
+            }))
+            sys.exit(1)
+
+        model_hash = weights_hash(args.model)
+        result = run_backfill(args, model, model_hash, profiler, tiling)
+
+        # Output JSON result
+        print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -8,11 +8,9 @@ import argparse
 import json
 import sys
 import os
-from pathlib import Path
-from ultralytics import YOLO
-import cv2
-import numpy as np
-from PIL import Image
+
+from model_cache import load_fused_model
+from profiling import add_profile_arguments, from_args as profiler_from_args
 
 # Import shared constants
 WASTE_CATEGORIES = {
@@ -28,14 +26,16 @@ WASTE_CATEGORIES = {
 def load_model(model_path='yolov8n.pt'):
     """Load YOLOv8 model for waste classification."""
     try:
-        model = YOLO(model_path)
+        model = load_fused_model(model_path)
         return model
     except Exception as e:
         print(f"Error loading model: {e}", file=sys.stderr)
         return None
 
-def classify_batch(image_paths, model, confidence_threshold=0.5):
+def classify_batch(image_paths, model, confidence_threshold=0.5, profiler=None):
     """Classify waste in multiple images."""
+    import cv2
+
     try:
         batch_results = []
         
@@ -63,7 +63,11 @@ def classify_batch(image_paths, model, confidence_threshold=0.5):
                 continue
             
             # Run inference
-            results = model(image)
+            if profiler is not None:
+                with profiler.torch_trace(os.path.basename(image_path)):
+                    results = model(image)
+            else:
+                results = model(image)
             
             # Process results
             detections = []
@@ -156,6 +160,7 @@ def main():
     parser.add_argument('--images', required=True, help='JSON array of image paths')
     parser.add_argument('--model', default='yolov8n.pt', help='Path to YOLOv8 model')
     parser.add_argument('--confidence', type=float, default=0.5, help='Confidence threshold')
+    add_profile_arguments(parser)
     
     args = parser.parse_args()
     
@@ -181,20 +186,23 @@ def main():
             }))
             sys.exit(1)
         
-        # Load model
-        model = load_model(args.model)
-        if model is None:
-            print(json.dumps({
-                'success': False,
-                'error': 'Failed to load YOLOv8 model'
-            }))
-            sys.exit(1)
-        
-        # Classify batch
-        result = classify_batch(image_paths, model, args.confidence)
-        
-        # Output JSON result
-        print(json.dumps(result, indent=2))
+        profiler = profiler_from_args(args, 'batch_classifier',
+                                      import_modules=('ultralytics', 'cv2', 'numpy'))
+        with profiler.session():
+            # Load model
+            model = load_model(args.model)
+            if model is None:
+                print(json.dumps({
+                    'success': False,
+                    'error': 'Failed to load YOLOv8 model'
+                }))
+                sys.exit(1)
+            
+            # Classify batch
+            result = classify_batch(image_paths, model, args.confidence, profiler)
+            
+            # Output JSON result
+            print(json.dumps(result, indent=2))
         
     except json.JSONDecodeError:
         print(json.dumps({
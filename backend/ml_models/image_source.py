@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Image input for the ML entry points
+Lets callers hand image bytes over stdin or a named shared-memory segment
+instead of writing them to ai-inputs/ and having the script read them back.
+
+Stdin framing: each frame is a 4-byte big-endian unsigned length followed by
+that many payload bytes.
+"""
+
+import contextlib
+import struct
+import sys
+
+FRAME_HEADER = struct.Struct('>I')
+
+
+def add_image_source_arguments(parser):
+    """Register --image / --image-stdin / --image-shm as mutually exclusive inputs."""
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--image', help='Path to input image')
+    group.add_argument('--image-stdin', action='store_true',
+                       help='Read one length-prefixed image frame from stdin')
+    group.add_argument('--image-shm', metavar='NAME',
+                       help='Read the image from the named shared-memory segment')
+    parser.add_argument('--image-size', type=int, metavar='BYTES',
+                        help='Number of image bytes in the shared-memory segment '
+                             '(defaults to the whole segment)')
+
+
+def describe_source(args):
+    """Return a short label for the image source, used in results and errors."""
+    if args.image_stdin:
+        return '<stdin>'
+    if args.image_shm:
+        return f'shm:{args.image_shm}'
+    return args.image
+
+
+def read_frame(stream):
+    """Read one length-prefixed frame from a binary stream.
+
+    Returns None on a clean EOF before the header, raises ValueError if the
+    stream ends in the middle of a frame.
+    """
+    header = _read_exact(stream, FRAME_HEADER.size)
+    if not header:
+        return None
+    if len(header) < FRAME_HEADER.size:
+        raise ValueError('Truncated frame header')
+    (length,) = FRAME_HEADER.unpack(header)
+    payload = _read_exact(stream, length)
+    if len(payload) < length:
+        raise ValueError(f'Truncated frame: expected {length} bytes, got {len(payload)}')
+    return payload
+
+
+def write_frame(stream, payload):
+    """Write one length-prefixed frame to a binary stream."""
+    stream.write(FRAME_HEADER.pack(len(payload)))
+    stream.write(payload)
+
+
+def _read_exact(stream, size):
+    """Read up to size bytes, stopping early only at EOF."""
+    chunks = []
+    remaining = size
+    while remaining:
+        chunk = stream.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+
+@contextlib.contextmanager
+def open_image_buffer(args):
+    """Yield the raw encoded image bytes for --image-stdin or --image-shm.
+
+    For shared memory the yielded object is a memoryview onto the segment
+    itself, so it must not be used after the context exits.
+    """
+    if args.image_stdin:
+        payload = read_frame(sys.stdin.buffer)
+        if payload is None:
+            raise ValueError('No image frame received on stdin')
+        yield payload
+        return
+
+    shm = attach_shared_memory(args.image_shm)
+    try:
+        size = args.image_size if args.image_size is not None else shm.size
+        if size > shm.size:
+            raise ValueError(f'Image size {size} exceeds shared-memory segment of {shm.size} bytes')
+        view = shm.buf[:size]
+        try:
+            yield view
+        finally:
+            view.release()
+    finally:
+        shm.close()
+
+
+def attach_shared_memory(name):
+    """Attach to an existing shared-memory segment without taking ownership of it."""
+    from multiprocessing import shared_memory
+
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+
+    shm = shared_memory.SharedMemory(name=name)
+    # Before 3.13 attaching registers the segment with the resource tracker,
+    # which would unlink it when we exit; the creator owns its lifetime.
+    from multiprocessing import resource_tracker
+    try:
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    except Exception:
+        pass
+    return shm
+
+
+def decode_image(buffer):
+    """Decode encoded image bytes straight into a BGR array (None if undecodable)."""
+    import cv2
+    import numpy as np
+
+    return cv2.imdecode(np.frombuffer(buffer, dtype=np.uint8), cv2.IMREAD_COLOR)
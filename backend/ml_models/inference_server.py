@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+Long-running Waste Classification Server
+Keeps YOLOv8 models loaded and serves classification requests from the
+Node.js backend through the priority scheduler.
+
+Protocol (stdin): each request is a length-prefixed JSON header frame
+    {"id": "...", "priority": "interactive" | "bulk", "confidence": 0.5,
+     "images": ["name", ...]}
+followed by one length-prefixed frame of encoded image bytes per entry in
+"images". A header may instead carry "paths": [...] to classify files on disk,
+and may override the server's tiling options with "tiled" ("off" | "auto" |
+"on"), "tile_size", "tile_overlap" and "tile_batch".
+
+Protocol (stdout): one JSON line per request, tagged with its "id".
+
+With several --models the server picks a model size per request from the
+queue depth and recent latency (see model_router.py).
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+from image_source import decode_image, read_frame
+from model_router import DEFAULT_LATENCY_TARGETS_MS, ModelPool, ModelRouter
+from profiling import add_profile_arguments, from_args as profiler_from_args
+from scheduler import PRIORITY_CLASSES, InferenceScheduler, QueueFullError
+from tiling import add_tiling_arguments, validate_tiling
+from waste_classifier import apply_confidence_threshold, classify_images, load_model
+
+_output_lock = threading.Lock()
+
+
+def write_response(response):
+    """Write one JSON response line; called from worker and reader threads."""
+    line = json.dumps(response)
+    with _output_lock:
+        sys.stdout.write(line + '\n')
+        sys.stdout.flush()
+
+
+class InvalidRequestError(Exception):
+    """A request that arrived intact but cannot be served; later requests still can."""
+
+    def __init__(self, message, request_id=None):
+        super().__init__(message)
+        self.request_id = request_id
+
+
+def read_request(stream):
+    """Read one request (header plus image frames); None on EOF.
+
+    Raises InvalidRequestError for a bad header once its frames are consumed,
+    and ValueError if the stream itself is broken.
+    """
+    header_frame = read_frame(stream)
+    if header_frame is None:
+        return None
+
+    try:
+        header = json.loads(header_frame.decode('utf-8'))
+    except ValueError as e:
+        raise InvalidRequestError(f'Invalid request header: {e}')
+    if not isinstance(header, dict):
+        raise InvalidRequestError('Request header must be a JSON object')
+
+    request_id = header.get('id')
+    images = header.get('images', [])
+    paths = header.get('paths', [])
+    # Without an image list the number of frames that follow is unknown
+    if not isinstance(images, list):
+        raise InvalidRequestError('"images" must be a list', request_id)
+
+    items = []
+    for name in images:
+        data = read_frame(stream)
+        if data is None:
+            raise ValueError(f'Missing image frame for {name}')
+        items.append({'image': str(name), 'data': data})
+    if not isinstance(paths, list) or not all(isinstance(p, str) for p in paths):
+        raise InvalidRequestError('"paths" must be a list of file paths', request_id)
+    for image_path in paths:
+        items.append({'image': image_path, 'path': image_path})
+    return header, items
+
+
+# Request header keys that override the server's tiling options
+TILING_HEADER_KEYS = {
+    'tiled': 'mode',
+    'tile_size': 'tile_size',
+    'tile_overlap': 'overlap',
+    'tile_batch': 'tile_batch'
+}
+
+
+def request_context(header, default_confidence, default_tiling):
+    """Validate per-request options into a job context."""
+    request_id = header.get('id')
+    confidence = header.get('confidence', default_confidence)
+    try:
+        confidence = float(confidence)
+    except (TypeError, ValueError):
+        raise InvalidRequestError(f'Invalid confidence: {confidence!r}', request_id)
+
+    tiling = dict(default_tiling)
+    for header_key, key in TILING_HEADER_KEYS.items():
+        if header_key in header:
+            tiling[key] = header[header_key]
+    try:
+        validate_tiling(tiling)
+    except ValueError as e:
+        raise InvalidRequestError(f'Invalid tiling options: {e}', request_id)
+
+    return {
+        'id': request_id,
+        'confidence': confidence,
+        'tiling': tiling if tiling['mode'] != 'off' else None
+    }
+
+
+def load_item(item):
+    """Decode one queued item into a BGR image (None if unreadable)."""
+    import cv2
+
+    if 'path' in item:
+        if not os.path.exists(item['path']):
+            return None
+        return cv2.imread(item['path'])
+    if not item['data']:
+        return None
+    return decode_image(item['data'])
+
+
+def select_model(pool, router, job, queue_depth):
+    """Pick (and load) the model for a job; all of its mini-batches use the same one."""
+    if 'model' in job.context:
+        return pool.get(job.context['model'])
+
+    # Interactive requests never wait for a model to load; bulk work loads them
+    loaded = pool.loaded() if job.priority == 'interactive' else None
+    # A model that fails to load is excluded by the router, so this terminates
+    for _ in range(len(router.models)):
+        name, reason = router.choose(job.priority, queue_depth, loaded=loaded)
+        model = pool.get(name)
+        if model is not None:
+            job.context.setdefault('model', name)
+            job.context.setdefault('model_selection', reason)
+            return pool.get(job.context['model'])
+    raise RuntimeError('No YOLOv8 model could be loaded')
+
+
+def make_process_batch(profiler, router, queue_depth):
+    def process_batch(pool, job, items):
+        model = select_model(pool, router, job, queue_depth())
+        with profiler.sample(job.priority):
+            images = [load_item(item) for item in items]
+            first_run = pool.first_run(job.context['model'])
+            started = time.monotonic()
+            results = classify_images(images, model, profiler,
+                                      sources=[item['image'] for item in items],
+                                      tiling=job.context['tiling'])
+            # A tiled image costs many inferences, so it says little about per-image latency
+            if not first_run and not any('tiling' in result for result in results):
+                router.record(job.context['model'], (time.monotonic() - started) * 1000 / len(items))
+        confidence = job.context['confidence']
+        for item, result in zip(items, results):
+            apply_confidence_threshold(result, confidence)
+            result['image'] = item['image']
+            result['model'] = job.context['model']
+            result['model_selection'] = job.context['model_selection']
+            # Release the encoded bytes as soon as the mini-batch is done
+            item.pop('data', None)
+        return results
+    return process_batch
+
+
+def warm_up(model):
+    """Run one inference on a blank frame at the model's native input size."""
+    import numpy as np
+
+    model(np.zeros((640, 640, 3), dtype=np.uint8), verbose=False)
+
+
+def job_response(job):
+    """Shape a finished job like batch_classifier.py output, plus scheduling data."""
+    scheduling = job.timing()
+    results = job.results
+    for result in results:
+        result['scheduling'] = scheduling
+    response = {
+        'id': job.context['id'],
+        'success': job.error is None,
+        'batch_results': results,
+        'total_images': len(results),
+        'processed_images': len([r for r in results if r.get('success')]),
+        'failed_images': len([r for r in results if not r.get('success')]),
+        'model': job.context.get('model'),
+        'model_selection': job.context.get('model_selection'),
+        'scheduling': scheduling
+    }
+    if job.error is not None:
+        response['error'] = job.error
+    return response
+
+
+def exit_when_broken(error):
+    """Exit non-zero once no worker could start, so the backend respawns the server.
+
+    Called on a worker thread; the reader thread may be blocked on stdin, so
+    the process exits directly after flushing the responses already written.
+    """
+    print(f"All inference workers failed to start, exiting: {error}", file=sys.stderr)
+    with _output_lock:
+        sys.stdout.flush()
+    os._exit(1)
+
+
+def serve(scheduler, default_confidence, default_tiling):
+    stream = sys.stdin.buffer
+    while True:
+        try:
+            request = read_request(stream)
+            if request is None:
+                break
+            header, items = request
+            context = request_context(header, default_confidence, default_tiling)
+        except InvalidRequestError as e:
+            write_response({
+                'id': e.request_id,
+                'success': False,
+                'error': str(e)
+            })
+            continue
+        except ValueError as e:
+            # Framing is lost at this point, so stop reading
+            print(f"Invalid request stream: {e}", file=sys.stderr)
+            break
+
+        request_id = context['id']
+        priority = header.get('priority', 'interactive')
+        if priority not in PRIORITY_CLASSES:
+            write_response({
+                'id': request_id,
+                'success': False,
+                'error': f'Unknown priority class: {priority}'
+            })
+            continue
+
+        try:
+            scheduler.submit(priority, items,
+                             on_done=lambda job: write_response(job_response(job)),
+                             context=context)
+        except QueueFullError as e:
+            write_response({
+                'id': request_id,
+                'success': False,
+                'rejected': True,
+                'error': str(e),
+                'scheduling': {'priority': priority, 'queue_wait_ms': 0.0}
+            })
+        except RuntimeError as e:
+            write_response({
+                'id': request_id,
+                'success': False,
+                'error': str(e)
+            })
+            if scheduler.broken is not None:
+                break
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Long-running Waste Classification Server')
+    parser.add_argument('--model', default='yolov8n.pt', help='Path to YOLOv8 model')
+    parser.add_argument('--models',
+                        help='Comma-separated YOLOv8 models, smallest first, to choose between '
+                             'by load (overrides --model)')
+    parser.add_argument('--latency-target-ms', type=float,
+                        default=DEFAULT_LATENCY_TARGETS_MS['interactive'],
+                        help='Per-image latency target for interactive requests')
+    parser.add_argument('--bulk-latency-target-ms', type=float,
+                        default=DEFAULT_LATENCY_TARGETS_MS['bulk'],
+                        help='Per-image latency target for bulk requests')
+    parser.add_argument('--pressure-queue-depth', type=int, default=4,
+                        help='Queue depth at which the smallest model is always used')
+    parser.add_argument('--preload', action='store_true',
+                        help='Load and warm up every model at startup instead of on first use')
+    parser.add_argument('--confidence', type=float, default=0.5, help='Default confidence threshold')
+    parser.add_argument('--workers', type=int, default=2, help='Number of inference worker threads')
+    parser.add_argument('--mini-batch', type=int, default=4,
+                        help='Images per bulk mini-batch; interactive work can start between mini-batches')
+    parser.add_argument('--interactive-concurrency', type=int, default=2,
+                        help='Max interactive mini-batches running at once')
+    parser.add_argument('--bulk-concurrency', type=int, default=1,
+                        help='Max bulk mini-batches running at once')
+    parser.add_argument('--interactive-queue', type=int, default=32,
+                        help='Max queued interactive requests before rejecting')
+    parser.add_argument('--bulk-queue', type=int, default=8,
+                        help='Max queued bulk requests before rejecting')
+    add_tiling_arguments(parser)
+    add_profile_arguments(parser, sampling=True)
+
+    args = parser.parse_args()
+
+    # Server-wide tiling defaults; requests may override them
+    try:
+        default_tiling = validate_tiling({
+            'mode': args.tiled,
+            'tile_size': args.tile_size,
+            'overlap': args.tile_overlap,
+            'tile_batch': args.tile_batch
+        })
+    except ValueError as e:
+        print(json.dumps({
+            'success': False,
+            'error': f'Invalid tiling options: {str(e)}'
+        }))
+        sys.exit(1)
+    if args.profile and not args.profile_sample:
+        # The whole-run profile only sees the reader thread, so profile every request
+        args.profile_sample = 1
+
+    profiler = profiler_from_args(args, 'inference_server',
+                                  import_modules=('ultralytics', 'cv2', 'numpy'))
+
+    models = [m.strip() for m in args.models.split(',') if m.strip()] if args.models else [args.model]
+    router = ModelRouter(
+        models,
+        latency_targets_ms={
+            'interactive': args.latency_target_ms,
+            'bulk': args.bulk_latency_target_ms
+        },
+        pressure_queue_depth=args.pressure_queue_depth
+    )
+
+    def worker_init():
+        # Each worker owns its model instances; YOLO predictors are not thread-safe
+        pool = ModelPool(load_model, router, preload=models if args.preload else models[:1],
+                         warmup=warm_up)
+        if pool.get(models[0]) is None:
+            raise RuntimeError(f'Failed to load YOLOv8 model: {models[0]}')
+        return pool
+
+    scheduler = InferenceScheduler(
+        make_process_batch(profiler, router, lambda: scheduler.queue_depth()),
+        worker_init=worker_init,
+        workers=args.workers,
+        mini_batch_size=args.mini_batch,
+        on_broken=exit_when_broken,
+        limits={
+            'interactive': {
+                'concurrency': args.interactive_concurrency,
+                'max_queue': args.interactive_queue
+            },
+            'bulk': {
+                'concurrency': args.bulk_concurrency,
+                'max_queue': args.bulk_queue
+            }
+        }
+    )
+
+    with profiler.session():
+        scheduler.start()
+        serve(scheduler, args.confidence, default_tiling)
+        scheduler.shutdown(wait=True)
+
+    if scheduler.broken is not None:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
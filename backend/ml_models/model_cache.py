@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Fused YOLOv8 model cache
+Loading weights with YOLO(model_path) rebuilds the network and fuses its
+Conv+BatchNorm layers on every process start. This module saves the fused,
+ready-to-run model once and loads that artifact on later starts. The cache
+key combines the weights SHA-256 with the ultralytics and torch versions, so
+new weights or a library upgrade produce a new entry. The SHA-256 itself is
+remembered per weights file and only recomputed when its size or mtime
+changes.
+
+The cache directory comes from YOLO_MODEL_CACHE (set it to "off" to
+disable) and defaults to ~/.cache/waste_management/fused_models.
+
+The ML scripts import ultralytics, torch, cv2 and numpy only where they are used.
+"""
+
+import hashlib
+import json
+import os
+import sys
+import tempfile
+
+DEFAULT_CACHE_DIR = os.path.join('~', '.cache', 'waste_management', 'fused_models')
+
+
+def weights_hash(model_path):
+    """SHA-256 of the weights file, or of the name if it is not a local file."""
+    if not os.path.isfile(model_path):
+        return hashlib.sha256(model_path.encode('utf-8')).hexdigest()
+
+    stat = os.stat(model_path)
+    sidecar = _hash_sidecar_path(model_path)
+    if sidecar is not None:
+        try:
+            with open(sidecar, 'r') as f:
+                remembered = json.load(f)
+            if remembered['size'] == stat.st_size and remembered['mtime_ns'] == stat.st_mtime_ns:
+                return remembered['sha256']
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    digest = hashlib.sha256()
+    with open(model_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    sha256 = digest.hexdigest()
+
+    if sidecar is not None:
+        record = json.dumps({
+            'path': os.path.abspath(model_path),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha256': sha256
+        }).encode('utf-8')
+        try:
+            _write_atomically(sidecar, lambda f: f.write(record))
+        except Exception as e:
+            print(f"Could not remember weights hash in {sidecar}: {e}", file=sys.stderr)
+    return sha256
+
+
+def _hash_sidecar_path(model_path):
+    """Where the SHA-256 of a weights file is remembered, or None if caching is off."""
+    directory = cache_dir()
+    if directory is None:
+        return None
+    name = hashlib.sha256(os.path.abspath(model_path).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(directory, 'hashes', f'{name}.json')
+
+
+def cache_dir():
+    """Resolved cache directory, or None if caching is disabled."""
+    configured = os.getenv('YOLO_MODEL_CACHE', DEFAULT_CACHE_DIR)
+    if configured.lower() in ('', '0', 'off', 'false'):
+        return None
+    return os.path.expanduser(configured)
+
+
+def cached_model_path(model_path, directory):
+    """Cache file for these weights under the installed library versions."""
+    import torch
+    import ultralytics
+
+    key = hashlib.sha256(
+        f'{weights_hash(model_path)}|ultralytics={ultralytics.__version__}|torch={torch.__version__}'.encode('utf-8')
+    ).hexdigest()[:16]
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    return os.path.join(directory, f'{stem}-fused-{key}.pt')
+
+
+def load_fused_model(model_path):
+    """Load a fused YOLO model, from the cache when possible."""
+    from ultralytics import YOLO
+
+    directory = cache_dir()
+    if directory is None or not model_path.endswith('.pt'):
+        return YOLO(model_path)
+
+    cached = None
+    if os.path.isfile(model_path):
+        cached = cached_model_path(model_path, directory)
+        if os.path.isfile(cached):
+            try:
+                return YOLO(cached)
+            except Exception as e:
+                print(f"Discarding unreadable fused model cache {cached}: {e}", file=sys.stderr)
+                _remove(cached)
+
+    # Cache miss: build from the original weights (ultralytics may download
+    # official weights here), fuse, and save for next time
+    model = YOLO(model_path)
+    model.fuse()
+    if cached is not None:
+        save_fused_model(model, cached)
+    return model
+
+
+def save_fused_model(model, path):
+    """Write the fused network as a checkpoint YOLO() can load directly."""
+    import torch
+
+    checkpoint = {
+        key: value for key, value in (model.ckpt or {}).items()
+        if key not in ('model', 'ema', 'optimizer')
+    }
+    checkpoint['model'] = model.model
+    checkpoint['ema'] = None
+    checkpoint['optimizer'] = None
+
+    try:
+        _write_atomically(path, lambda f: torch.save(checkpoint, f))
+    except Exception as e:
+        print(f"Could not write fused model cache {path}: {e}", file=sys.stderr)
+
+
+def _write_atomically(path, write):
+    """Write a file via a uniquely named temporary file and os.replace().
+
+    Readers never see a half-written file, and concurrent writers (worker
+    threads or processes building the same entry) do not share a temp file.
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(temporary, path)
+    except BaseException:
+        _remove(temporary)
+        raise
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
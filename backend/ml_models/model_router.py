@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Load-adaptive YOLOv8 model selection
+Picks a model size per request from the current queue depth and the recent
+per-image latency of each model: the largest model that is predicted to meet
+the latency target when idle, degrading towards the nano model under pressure.
+"""
+
+import sys
+import threading
+import time
+
+# Smallest (fastest) first; same weights health_check.check_model_files knows about
+DEFAULT_MODELS = ('yolov8n.pt', 'yolov8s.pt', 'yolov8m.pt')
+
+DEFAULT_LATENCY_TARGETS_MS = {
+    'interactive': 500.0,
+    'bulk': 2000.0
+}
+
+# Only these classes may be sent to an unmeasured or too-slow model to measure it
+PROBE_PRIORITIES = ('bulk',)
+
+
+class ModelRouter:
+    """Chooses among models ordered from smallest to largest.
+
+    Latency per image is tracked as an exponentially weighted moving average
+    per model, seeded by the warm-up inference of preloaded models. A model
+    that has never run is only tried by bulk work while the scheduler is idle.
+    A model whose average misses the target is re-measured the same way once
+    its last sample is ``reprobe_interval_s`` old, so one slow run does not
+    exclude it for good. Interactive requests never act as probes.
+    """
+
+    def __init__(self, models=DEFAULT_MODELS, latency_targets_ms=None,
+                 pressure_queue_depth=4, smoothing=0.3, reprobe_interval_s=60.0):
+        if not models:
+            raise ValueError('At least one model is required')
+        self.models = list(models)
+        self.latency_targets_ms = dict(DEFAULT_LATENCY_TARGETS_MS)
+        self.latency_targets_ms.update(latency_targets_ms or {})
+        self.pressure_queue_depth = pressure_queue_depth
+        self.smoothing = smoothing
+        self.reprobe_interval_s = reprobe_interval_s
+
+        self._latency_ms = {}
+        self._sampled_at = {}
+        self._unavailable = set()
+        self._lock = threading.Lock()
+
+    def choose(self, priority, queue_depth, loaded=None):
+        """Return (model, reason) for a request of this priority class.
+
+        ``loaded``, if given, restricts the choice to models that are already
+        loaded, so the request does not pay for loading one.
+        """
+        with self._lock:
+            candidates = [m for m in self.models if m not in self._unavailable]
+            if loaded is not None:
+                candidates = [m for m in candidates if m in loaded]
+            if not candidates:
+                candidates = self.models[:1]
+            smallest = candidates[0]
+
+            if len(candidates) == 1:
+                return smallest, 'only model available'
+
+            if queue_depth >= self.pressure_queue_depth:
+                return smallest, (
+                    f'queue depth {queue_depth} >= {self.pressure_queue_depth}, '
+                    f'using smallest model'
+                )
+
+            target = self.latency_targets_ms.get(priority, DEFAULT_LATENCY_TARGETS_MS['interactive'])
+            now = time.monotonic()
+            for model in reversed(candidates):
+                latency = self._latency_ms.get(model)
+                probe = queue_depth == 0 and priority in PROBE_PRIORITIES
+                if latency is None:
+                    if probe:
+                        self._sampled_at[model] = now
+                        return model, 'idle, measuring latency of unmeasured model'
+                    continue
+
+                # Queued jobs ahead of us each cost roughly one inference
+                predicted = latency * (queue_depth + 1)
+                if predicted <= target:
+                    return model, (
+                        f'predicted {predicted:.0f} ms <= {target:.0f} ms target '
+                        f'at queue depth {queue_depth}'
+                    )
+
+                if probe and now - self._sampled_at.get(model, now) >= self.reprobe_interval_s:
+                    # Claim the probe so concurrent idle requests do not all take it
+                    self._sampled_at[model] = now
+                    return model, (
+                        f'idle, re-measuring latency ({latency:.0f} ms per image '
+                        f'missed {target:.0f} ms target)'
+                    )
+
+            return smallest, f'no larger model meets {target:.0f} ms target at queue depth {queue_depth}'
+
+    def record(self, model, latency_ms_per_image):
+        """Feed back the observed per-image latency of a finished mini-batch."""
+        with self._lock:
+            self._sampled_at[model] = time.monotonic()
+            previous = self._latency_ms.get(model)
+            if previous is None:
+                self._latency_ms[model] = latency_ms_per_image
+            else:
+                self._latency_ms[model] = (
+                    self.smoothing * latency_ms_per_image + (1 - self.smoothing) * previous
+                )
+
+    def mark_unavailable(self, model, error):
+        """Stop routing to a model that failed to load."""
+        with self._lock:
+            if model in self._unavailable:
+                return
+            self._unavailable.add(model)
+        print(f"Model {model} unavailable, excluded from routing: {error}", file=sys.stderr)
+
+    def stats(self):
+        with self._lock:
+            return {
+                model: {
+                    'latency_ms': round(self._latency_ms[model], 1) if model in self._latency_ms else None,
+                    'available': model not in self._unavailable
+                }
+                for model in self.models
+            }
+
+
+class ModelPool:
+    """Per-worker set of loaded models, loading each lazily on first use.
+
+    ``warmup(model)``, if given, runs one inference on each preloaded model.
+    The first call builds the predictor; a second, timed call seeds the
+    router's latency estimate, so no request has to measure the model.
+    """
+
+    def __init__(self, loader, router, preload=(), warmup=None):
+        self.loader = loader
+        self.router = router
+        self._models = {}
+        self._has_run = set()
+        for model in preload:
+            loaded = self.get(model)
+            if loaded is not None and warmup is not None:
+                try:
+                    warmup(loaded)
+                    started = time.monotonic()
+                    warmup(loaded)
+                    router.record(model, (time.monotonic() - started) * 1000)
+                    self._has_run.add(model)
+                except Exception as e:
+                    print(f"Warm-up of {model} failed: {e}", file=sys.stderr)
+
+    def get(self, model):
+        """Return the loaded model, or None if it cannot be loaded."""
+        if model not in self._models:
+            loaded = self.loader(model)
+            if loaded is None:
+                self.router.mark_unavailable(model, 'failed to load')
+            self._models[model] = loaded
+        return self._models[model]
+
+    def loaded(self):
+        """Names of the models this worker has loaded successfully."""
+        return {model for model, loaded in self._models.items() if loaded is not None}
+
+    def first_run(self, model):
+        """True on a model's first inference in this worker, then False.
+
+        The first call also builds the predictor, so its latency is not
+        representative and should not be fed to the router.
+        """
+        if model in self._has_run:
+            return False
+        self._has_run.add(model)
+        return True
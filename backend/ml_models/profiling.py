@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Profiling hooks for the ML entry points
+Shared by waste_classifier.py, batch_classifier.py and waste_analyzer.py to
+capture cProfile dumps, import-time breakdowns and torch profiler traces.
+"""
+
+import contextlib
+import itertools
+import os
+import sys
+import threading
+import time
+
+
+def add_profile_arguments(parser, torch_trace=True, sampling=False):
+    """Register the --profile family of options on an argparse parser."""
+    parser.add_argument('--profile', metavar='DIR',
+                        help='Write a cProfile dump and import-time breakdown to DIR')
+    if torch_trace:
+        parser.add_argument('--profile-torch', action='store_true',
+                            help='Also record a torch profiler trace of inference (requires --profile)')
+    if sampling:
+        parser.add_argument('--profile-sample', type=int, default=0, metavar='N',
+                            help='Profile 1 in N requests instead of the whole run (requires --profile)')
+
+
+def from_args(args, name, import_modules=()):
+    """Build a Profiler from parsed arguments (a disabled one if --profile is unset)."""
+    return Profiler(
+        output_dir=getattr(args, 'profile', None),
+        name=name,
+        import_modules=import_modules,
+        torch_trace=getattr(args, 'profile_torch', False),
+        sample_every=getattr(args, 'profile_sample', 0)
+    )
+
+
+class Profiler:
+    """Collects profiling output for one process into a directory.
+
+    When ``output_dir`` is None every hook is a no-op context manager, so
+    callers can wrap their hot paths unconditionally.
+    """
+
+    def __init__(self, output_dir=None, name='run', import_modules=(),
+                 torch_trace=False, sample_every=0):
+        self.enabled = bool(output_dir)
+        self.output_dir = output_dir
+        self.name = name
+        self.import_modules = tuple(import_modules)
+        self.torch_trace_enabled = self.enabled and torch_trace
+        self.sample_every = sample_every if self.enabled else 0
+        self._counter = itertools.count(1)
+        self._trace_counter = itertools.count(1)
+        # Whether the current thread is inside a sampled request
+        self._local = threading.local()
+        self._stamp = time.strftime('%Y%m%d-%H%M%S') + f'-{os.getpid()}'
+
+        if self.enabled:
+            os.makedirs(self.output_dir, exist_ok=True)
+
+    def _path(self, suffix):
+        return os.path.join(self.output_dir, f'{self.name}-{self._stamp}{suffix}')
+
+    @contextlib.contextmanager
+    def session(self):
+        """Profile the enclosed block as one run (skipped in sampling mode)."""
+        if not self.enabled:
+            yield
+            return
+
+        self.write_import_times()
+        if self.sample_every:
+            # Per-request sampling replaces the whole-run profile
+            yield
+            return
+
+        with self._cprofile(self._path('.prof')):
+            yield
+
+    @contextlib.contextmanager
+    def sample(self, label='request'):
+        """Profile the enclosed request if it is the 1-in-N sampled one."""
+        if not self.sample_every:
+            yield
+            return
+
+        index = next(self._counter)
+        if index % self.sample_every:
+            yield
+            return
+
+        self._local.sampled = True
+        try:
+            with self._cprofile(self._path(f'-{label}-{index}.prof')):
+                yield
+        finally:
+            self._local.sampled = False
+
+    @contextlib.contextmanager
+    def torch_trace(self, label='inference'):
+        """Record a torch profiler trace around model inference.
+
+        In sampling mode only requests picked by sample() are traced. Each
+        trace gets its own numbered file.
+        """
+        if not self.torch_trace_enabled or (
+                self.sample_every and not getattr(self._local, 'sampled', False)):
+            yield
+            return
+
+        try:
+            from torch.profiler import profile, ProfilerActivity
+        except ImportError as e:
+            print(f"Torch profiler unavailable: {e}", file=sys.stderr)
+            yield
+            return
+
+        with profile(activities=[ProfilerActivity.CPU], record_shapes=True) as prof:
+            yield
+        index = next(self._trace_counter)
+        prof.export_chrome_trace(self._path(f'-{label}-{index}.trace.json'))
+
+    @contextlib.contextmanager
+    def _cprofile(self, dump_path):
+        # Imported on use to keep profiling-disabled startup cheap
+        import cProfile
+        import io
+        import pstats
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(dump_path)
+
+            # Human readable summary next to the binary dump
+            stream = io.StringIO()
+            stats = pstats.Stats(profiler, stream=stream)
+            stats.sort_stats('cumulative').print_stats(40)
+            with open(dump_path[:-len('.prof')] + '.txt', 'w') as f:
+                f.write(stream.getvalue())
+
+    def write_import_times(self):
+        """Record `python -X importtime` for this entry point's heavy imports.
+
+        Runs in a fresh interpreter so the numbers reflect a cold import,
+        independent of what this process has already loaded.
+        """
+        if not self.enabled or not self.import_modules:
+            return
+
+        import subprocess
+
+        statement = '; '.join(f'import {module}' for module in self.import_modules)
+        try:
+            completed = subprocess.run(
+                [sys.executable, '-X', 'importtime', '-c', statement],
+                capture_output=True,
+                text=True,
+                timeout=300
+            )
+        except Exception as e:
+            print(f"Import-time profiling failed: {e}", file=sys.stderr)
+            return
+
+        rows = []
+        for line in completed.stderr.splitlines():
+            if not line.startswith('import time:') or 'self [us]' in line:
+                continue
+            parts = line[len('import time:'):].split('|')
+            if len(parts) != 3:
+                continue
+            rows.append((int(parts[1]), int(parts[0]), parts[2].strip()))
+
+        with open(self._path('-importtime.txt'), 'w') as f:
+            f.write(f'# {statement}\n')
+            f.write('# cumulative [us] | self [us] | package\n')
+            for cumulative, own, package in sorted(rows, reverse=True):
+                f.write(f'{cumulative:>12} | {own:>10} | {package}\n')
+            if completed.returncode != 0:
+                f.write('\n# import failed:\n')
+                f.write(completed.stderr[-2000:])
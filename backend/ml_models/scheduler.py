@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Priority-aware inference scheduler
+Queues classification jobs in priority classes and runs them on a fixed pool
+of worker threads. Bulk jobs are split into mini-batches, so an interactive
+job submitted while a bulk job is running starts at the next mini-batch
+boundary instead of waiting for the whole batch.
+"""
+
+import collections
+import sys
+import threading
+import time
+
+# Highest priority first
+PRIORITY_CLASSES = ('interactive', 'bulk')
+
+DEFAULT_LIMITS = {
+    'interactive': {'concurrency': 2, 'max_queue': 32},
+    'bulk': {'concurrency': 1, 'max_queue': 8}
+}
+
+
+class QueueFullError(Exception):
+    """Raised by submit() when a priority class already has max_queue jobs waiting."""
+
+
+class Job:
+    """One submitted request: a list of items processed in mini-batches."""
+
+    def __init__(self, priority, items, mini_batch_size, on_done=None, context=None):
+        self.priority = priority
+        self.items = items
+        self.context = context
+        self.results = [None] * len(items)
+        # Set when the whole job failed, e.g. no worker could start
+        self.error = None
+        self.on_done = on_done
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self.done = threading.Event()
+
+        self._next_index = 0
+        self._outstanding = 0
+        self._mini_batch_size = len(items) if priority == 'interactive' else mini_batch_size
+
+    @property
+    def fully_dispatched(self):
+        return self._next_index >= len(self.items)
+
+    def _take_unit(self):
+        start = self._next_index
+        end = min(start + max(self._mini_batch_size, 1), len(self.items))
+        self._next_index = end
+        self._outstanding += 1
+        if self.started_at is None:
+            self.started_at = time.monotonic()
+        return start, end
+
+    def timing(self):
+        """Scheduling metadata reported alongside each result."""
+        started = self.started_at if self.started_at is not None else time.monotonic()
+        finished = self.finished_at if self.finished_at is not None else time.monotonic()
+        return {
+            'priority': self.priority,
+            'queue_wait_ms': round((started - self.submitted_at) * 1000, 1),
+            'total_ms': round((finished - self.submitted_at) * 1000, 1)
+        }
+
+    def wait(self, timeout=None):
+        self.done.wait(timeout)
+        return self.results
+
+
+class InferenceScheduler:
+    """Runs jobs from per-class queues on a pool of worker threads.
+
+    ``process_batch(state, job, items)`` is called on a worker thread and must
+    return one result per item. ``worker_init()`` is called once per worker to
+    build its private state (typically a loaded model, since model instances
+    are not shared between threads).
+    """
+
+    def __init__(self, process_batch, worker_init=None, workers=2,
+                 limits=None, mini_batch_size=4, on_broken=None):
+        self.process_batch = process_batch
+        self.worker_init = worker_init
+        self.on_broken = on_broken
+        self.workers = workers
+        self.mini_batch_size = mini_batch_size
+        self.limits = {cls: dict(DEFAULT_LIMITS[cls]) for cls in PRIORITY_CLASSES}
+        for cls, overrides in (limits or {}).items():
+            self.limits[cls].update(overrides)
+
+        self._queues = {cls: collections.deque() for cls in PRIORITY_CLASSES}
+        self._running = {cls: 0 for cls in PRIORITY_CLASSES}
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._threads = []
+        self._live_workers = 0
+        self._broken = None
+
+    def start(self):
+        self._live_workers = self.workers
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f'inference-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def shutdown(self, wait=True):
+        """Stop accepting work; workers exit once the queues are drained."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def submit(self, priority, items, on_done=None, context=None):
+        """Queue a job, or raise QueueFullError immediately if its class is full.
+
+        ``context`` is carried on the job for process_batch (e.g. request options).
+        """
+        if priority not in self._queues:
+            raise ValueError(f'Unknown priority class: {priority}')
+
+        job = Job(priority, list(items), self.mini_batch_size, on_done, context)
+        with self._cond:
+            if self._broken is not None:
+                raise RuntimeError(f'No inference workers available: {self._broken}')
+            if self._stopping:
+                raise QueueFullError('Scheduler is shutting down')
+            if len(self._queues[priority]) >= self.limits[priority]['max_queue']:
+                raise QueueFullError(
+                    f"{priority} queue is full ({self.limits[priority]['max_queue']} jobs waiting)"
+                )
+            if not job.items:
+                job.finished_at = job.started_at = time.monotonic()
+            else:
+                self._queues[priority].append(job)
+                self._cond.notify()
+
+        if not job.items:
+            self._finish(job)
+        return job
+
+    @property
+    def broken(self):
+        """Why every worker failed to start, or None while the scheduler is usable."""
+        with self._cond:
+            return self._broken
+
+    def queue_depth(self, priority=None):
+        """Number of jobs waiting (or partially dispatched) in one or all classes."""
+        with self._cond:
+            if priority is not None:
+                return len(self._queues[priority])
+            return sum(len(queue) for queue in self._queues.values())
+
+    def stats(self):
+        with self._cond:
+            return {
+                cls: {
+                    'queued': len(self._queues[cls]),
+                    'running': self._running[cls],
+                    **self.limits[cls]
+                }
+                for cls in PRIORITY_CLASSES
+            }
+
+    def _next_unit(self):
+        """Pick the next mini-batch: highest class first, within its concurrency limit."""
+        for cls in PRIORITY_CLASSES:
+            queue = self._queues[cls]
+            if queue and self._running[cls] < self.limits[cls]['concurrency']:
+                job = queue[0]
+                start, end = job._take_unit()
+                if job.fully_dispatched:
+                    queue.popleft()
+                self._running[cls] += 1
+                return job, start, end
+        return None
+
+    def _worker(self):
+        try:
+            state = self.worker_init() if self.worker_init else None
+        except Exception as e:
+            print(f"Inference worker failed to start: {e}", file=sys.stderr)
+            self._worker_failed(str(e))
+            return
+
+        while True:
+            with self._cond:
+                unit = self._next_unit()
+                while unit is None:
+                    if self._stopping and not any(self._queues.values()):
+                        return
+                    self._cond.wait()
+                    unit = self._next_unit()
+
+            job, start, end = unit
+            try:
+                results = self.process_batch(state, job, job.items[start:end])
+            except Exception as e:
+                results = [{'success': False, 'error': str(e)} for _ in range(end - start)]
+
+            with self._cond:
+                job.results[start:end] = results
+                job._outstanding -= 1
+                self._running[job.priority] -= 1
+                finished = job.fully_dispatched and job._outstanding == 0
+                if finished:
+                    job.finished_at = time.monotonic()
+                # A slot in this class freed up, so another worker may proceed
+                self._cond.notify_all()
+
+            if finished:
+                self._finish(job)
+
+    def _worker_failed(self, error):
+        """Fail all queued work once the last worker has failed to start."""
+        with self._cond:
+            self._live_workers -= 1
+            if self._live_workers > 0:
+                return
+            self._broken = error
+            abandoned = []
+            for queue in self._queues.values():
+                abandoned.extend(queue)
+                queue.clear()
+
+        message = f'No inference workers available: {error}'
+        for job in abandoned:
+            job.error = message
+            job.results = [{'success': False, 'error': message} for _ in job.items]
+            job.finished_at = time.monotonic()
+            self._finish(job)
+
+        if self.on_broken is not None:
+            self.on_broken(error)
+
+    def _finish(self, job):
+        job.done.set()
+        if job.on_done is not None:
+            try:
+                job.on_done(job)
+            except Exception as e:
+                print(f"Job completion callback failed: {e}", file=sys.stderr)
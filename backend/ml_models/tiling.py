@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Tiled inference for large images
+Splits drone and panoramic shots into overlapping tiles at the model's input
+size so small litter is not lost to downsampling. Tiles are slices (views) of
+the decoded frame, not copies, and are run through the model a fixed number
+at a time. Boxes are mapped back to full-image coordinates and merged across
+tile borders with class-aware NMS after every tile batch. Apart from the
+decoded frame itself, memory therefore depends on the tile size and tile
+batch, not on the image size.
+"""
+
+# Tile only when the longer side exceeds this multiple of the tile size
+AUTO_TILE_FACTOR = 2
+
+DEFAULT_TILE_SIZE = 640
+DEFAULT_TILE_OVERLAP = 0.2
+DEFAULT_TILE_BATCH = 8
+DEFAULT_MERGE_IOU = 0.5
+# A box cut off by a tile border that lies mostly inside another box of the
+# same class is the same object seen whole from the neighbouring tile
+DEFAULT_MERGE_CONTAINMENT = 0.8
+# Pixels within which a box edge counts as touching a tile border
+BORDER_TOLERANCE = 2
+
+
+def add_tiling_arguments(parser):
+    """Register the --tiled family of options on an argparse parser."""
+    parser.add_argument('--tiled', choices=('off', 'auto', 'on'), default='off',
+                        help='Tiled inference for large images (auto: only when the longer side '
+                             f'exceeds {AUTO_TILE_FACTOR}x the tile size)')
+    parser.add_argument('--tile-size', type=int, default=DEFAULT_TILE_SIZE,
+                        help="Tile edge in pixels; use the model's native input size")
+    parser.add_argument('--tile-overlap', type=float, default=DEFAULT_TILE_OVERLAP,
+                        help='Fraction of each tile shared with its neighbour')
+    parser.add_argument('--tile-batch', type=int, default=DEFAULT_TILE_BATCH,
+                        help='Tiles per model call; bounds inference memory')
+
+
+def tiling_options(args):
+    """Tiling settings from parsed arguments, or None when tiling is off.
+
+    Raises ValueError for settings that validate_tiling() rejects.
+    """
+    if args.tiled == 'off':
+        return None
+    return validate_tiling({
+        'mode': args.tiled,
+        'tile_size': args.tile_size,
+        'overlap': args.tile_overlap,
+        'tile_batch': args.tile_batch
+    })
+
+
+def validate_tiling(tiling):
+    """Return the settings unchanged, or raise ValueError if they are unusable.
+
+    A tile size below 1 yields empty tiles, and an overlap of 1 or more
+    shrinks the step to a single pixel (millions of tiles on a drone image).
+    """
+    if tiling['mode'] not in ('off', 'auto', 'on'):
+        raise ValueError(f"Tiling mode must be off, auto or on, not {tiling['mode']!r}")
+    for key, label in (('tile_size', 'Tile size'), ('tile_batch', 'Tile batch')):
+        value = tiling[key]
+        if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+            raise ValueError(f'{label} must be a positive integer, not {value!r}')
+    overlap = tiling['overlap']
+    if isinstance(overlap, bool) or not isinstance(overlap, (int, float)) or not 0 <= overlap < 1:
+        raise ValueError(f'Tile overlap must be in [0, 1), not {overlap!r}')
+    if int(tiling['tile_size'] * (1 - overlap)) < 1:
+        raise ValueError(f"Tile overlap {overlap!r} leaves no step between {tiling['tile_size']} px tiles")
+    return tiling
+
+
+def should_tile(image, tile_size, mode='auto'):
+    """Decide whether to tile an image under the on/off/auto modes."""
+    if mode == 'off' or image is None:
+        return False
+    if mode == 'on':
+        return True
+    height, width = image.shape[:2]
+    return max(height, width) > tile_size * AUTO_TILE_FACTOR
+
+
+def tile_origins(length, tile_size, overlap):
+    """Start offsets along one axis so tiles of tile_size cover [0, length)."""
+    if length <= tile_size:
+        return [0]
+    step = int(tile_size * (1 - overlap))
+    origins = list(range(0, length - tile_size, step))
+    # Last tile is flush with the edge instead of running past it
+    origins.append(length - tile_size)
+    return origins
+
+
+def iter_tiles(image, tile_size, overlap):
+    """Yield (x0, y0, tile view) over the image, row by row."""
+    height, width = image.shape[:2]
+    for y0 in tile_origins(height, tile_size, overlap):
+        for x0 in tile_origins(width, tile_size, overlap):
+            yield x0, y0, image[y0:y0 + tile_size, x0:x0 + tile_size]
+
+
+def merge_boxes(boxes, scores, classes, clipped=None, iou_threshold=DEFAULT_MERGE_IOU,
+                containment_threshold=DEFAULT_MERGE_CONTAINMENT):
+    """Class-aware greedy NMS that also joins objects split by tile borders.
+
+    A box is suppressed by a higher-scoring box of the same class if their
+    IoU exceeds iou_threshold. A pair is also merged if the smaller box is
+    ``clipped`` (it touches an inner tile border) and most of it lies inside
+    the other (intersection over the smaller area > containment_threshold).
+    The merged box then spans both, so the whole object is kept rather than
+    the cut-off part. Nested detections away from tile borders are left
+    alone.
+
+    Returns (boxes, scores, classes, clipped) for the kept boxes, best first.
+    """
+    import numpy as np
+
+    if clipped is None:
+        clipped = np.zeros(len(scores), dtype=bool)
+    boxes = boxes.copy()
+    clipped = clipped.copy()
+    order = np.argsort(-scores)
+    areas = np.clip(boxes[:, 2] - boxes[:, 0], 0, None) * np.clip(boxes[:, 3] - boxes[:, 1], 0, None)
+    keep = []
+    while order.size:
+        best = order[0]
+        keep.append(best)
+        rest = order[1:]
+        rest = rest[classes[rest] == classes[best]] if rest.size else rest
+        suppressed = rest[:0]
+        while rest.size:
+            iou, containment = _overlaps(boxes, areas, best, rest)
+            smaller_clipped = np.where(areas[rest] <= areas[best], clipped[rest], clipped[best])
+            joined = rest[(containment > containment_threshold) & smaller_clipped]
+            if not joined.size:
+                suppressed = np.union1d(suppressed, rest[iou > iou_threshold])
+                break
+            # Grow the box to cover the joined parts, then compare the rest against the new extent
+            group = np.append(joined, best)
+            boxes[best, :2] = boxes[group, :2].min(axis=0)
+            boxes[best, 2:] = boxes[group, 2:].max(axis=0)
+            areas[best] = (boxes[best, 2] - boxes[best, 0]) * (boxes[best, 3] - boxes[best, 1])
+            clipped[best] = clipped[group].all()
+            suppressed = np.union1d(suppressed, joined)
+            rest = rest[~np.isin(rest, joined)]
+        order = order[1:]
+        if suppressed.size:
+            order = order[~np.isin(order, suppressed)]
+    keep = np.array(keep, dtype=np.int64)
+    return boxes[keep], scores[keep], classes[keep], clipped[keep]
+
+
+def _overlaps(boxes, areas, best, rest):
+    """IoU and intersection over the smaller area between one box and several others."""
+    import numpy as np
+
+    x1 = np.maximum(boxes[best, 0], boxes[rest, 0])
+    y1 = np.maximum(boxes[best, 1], boxes[rest, 1])
+    x2 = np.minimum(boxes[best, 2], boxes[rest, 2])
+    y2 = np.minimum(boxes[best, 3], boxes[rest, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    union = areas[best] + areas[rest] - intersection
+    iou = intersection / np.maximum(union, 1e-9)
+    containment = intersection / np.maximum(np.minimum(areas[best], areas[rest]), 1e-9)
+    return iou, containment
+
+
+def touches_inner_border(tile_boxes, x0, y0, tile_width, tile_height, width, height):
+    """Flag tile boxes (already in image coordinates) cut by a border shared with another tile."""
+    import numpy as np
+
+    clipped = np.zeros(len(tile_boxes), dtype=bool)
+    if x0 > 0:
+        clipped |= tile_boxes[:, 0] <= x0 + BORDER_TOLERANCE
+    if y0 > 0:
+        clipped |= tile_boxes[:, 1] <= y0 + BORDER_TOLERANCE
+    if x0 + tile_width < width:
+        clipped |= tile_boxes[:, 2] >= x0 + tile_width - BORDER_TOLERANCE
+    if y0 + tile_height < height:
+        clipped |= tile_boxes[:, 3] >= y0 + tile_height - BORDER_TOLERANCE
+    return clipped
+
+
+def tiled_predict(image, model, tile_size=DEFAULT_TILE_SIZE, overlap=DEFAULT_TILE_OVERLAP,
+                  tile_batch=DEFAULT_TILE_BATCH, profiler=None):
+    """Run the model over overlapping tiles of a BGR image.
+
+    Returns (boxes, scores, classes) as numpy arrays with boxes in
+    full-image x1, y1, x2, y2 pixel coordinates, already merged.
+    """
+    import contextlib
+
+    import numpy as np
+
+    height, width = image.shape[:2]
+    boxes = np.zeros((0, 4), dtype=np.float32)
+    scores = np.zeros((0,), dtype=np.float32)
+    classes = np.zeros((0,), dtype=np.int64)
+    clipped = np.zeros((0,), dtype=bool)
+
+    def run(batch):
+        nonlocal boxes, scores, classes, clipped
+        trace = profiler.torch_trace('tiles') if profiler is not None else contextlib.nullcontext()
+        with trace:
+            results = model([tile for _, _, tile in batch], imgsz=tile_size)
+
+        new_boxes = [boxes]
+        new_scores = [scores]
+        new_classes = [classes]
+        new_clipped = [clipped]
+        for (x0, y0, tile), result in zip(batch, results):
+            if result.boxes is None or len(result.boxes) == 0:
+                continue
+            tile_boxes = result.boxes.xyxy.cpu().numpy().astype(np.float32)
+            tile_boxes[:, [0, 2]] += x0
+            tile_boxes[:, [1, 3]] += y0
+            new_boxes.append(tile_boxes)
+            new_scores.append(result.boxes.conf.cpu().numpy().astype(np.float32))
+            new_classes.append(result.boxes.cls.cpu().numpy().astype(np.int64))
+            new_clipped.append(touches_inner_border(tile_boxes, x0, y0, tile.shape[1], tile.shape[0],
+                                                    width, height))
+
+        boxes = np.concatenate(new_boxes)
+        scores = np.concatenate(new_scores)
+        classes = np.concatenate(new_classes)
+        clipped = np.concatenate(new_clipped)
+        # Merge as we go so the kept set stays small however many tiles there are
+        if len(scores):
+            boxes, scores, classes, clipped = merge_boxes(boxes, scores, classes, clipped)
+
+    batch = []
+    for tile in iter_tiles(image, tile_size, overlap):
+        batch.append(tile)
+        if len(batch) >= max(tile_batch, 1):
+            run(batch)
+            batch = []
+    if batch:
+        run(batch)
+
+    return boxes, scores, classes
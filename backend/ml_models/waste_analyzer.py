@@ -5,29 +5,29 @@ This script provides advanced analysis of waste images using Groq's AI models.
 """
 
 import argparse
+import contextlib
 import json
 import sys
 import os
 import base64
-from pathlib import Path
-import requests
-from PIL import Image
 import io
 
-def encode_image_to_base64(image_path):
-    """Encode image to base64 string for API transmission."""
+from image_source import add_image_source_arguments, describe_source, open_image_buffer
+from profiling import add_profile_arguments, from_args as profiler_from_args
+
+def analyze_waste_bytes(image_bytes, api_key):
+    """Analyze an in-memory waste image using Groq API."""
     try:
-        with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode('utf-8')
-    except Exception as e:
-        print(f"Error encoding image: {e}", file=sys.stderr)
-        return None
+        import requests
+    except ImportError as e:
+        return {
+            'success': False,
+            'error': f'Analysis failed: {str(e)}'
+        }
 
-def analyze_waste_with_groq(image_path, api_key):
-    """Analyze waste image using Groq API."""
     try:
         # Encode image
-        base64_image = encode_image_to_base64(image_path)
+        base64_image = base64.b64encode(image_bytes).decode('utf-8')
         if not base64_image:
             return {
                 'success': False,
@@ -149,10 +149,14 @@ Please provide a structured JSON response with these categories."""
             'error': f'Analysis failed: {str(e)}'
         }
 
-def get_image_metadata(image_path):
-    """Get basic image metadata."""
+def get_image_metadata(image):
+    """Get basic image metadata from a path or in-memory image bytes."""
     try:
-        with Image.open(image_path) as img:
+        from PIL import Image
+
+        if not isinstance(image, (str, os.PathLike)):
+            image = io.BytesIO(image)
+        with Image.open(image) as img:
             return {
                 'format': img.format,
                 'mode': img.mode,
@@ -165,46 +169,70 @@ def get_image_metadata(image_path):
             'error': f'Failed to get image metadata: {str(e)}'
         }
 
+def analyze(image_bytes, api_key):
+    """Return (metadata, analysis result) for one in-memory image."""
+    # Get image metadata
+    metadata = get_image_metadata(image_bytes)
+    
+    # Analyze waste
+    result = analyze_waste_bytes(image_bytes, api_key)
+    return metadata, result
+
 def main():
     parser = argparse.ArgumentParser(description='Waste Analysis using Groq API')
-    parser.add_argument('--image', required=True, help='Path to input image')
+    add_image_source_arguments(parser)
     parser.add_argument('--api-key', required=True, help='Groq API key')
     parser.add_argument('--output', help='Output file path (optional)')
+    add_profile_arguments(parser, torch_trace=False)
     
     args = parser.parse_args()
     
     # Check if image exists
-    if not os.path.exists(args.image):
+    if args.image is not None and not os.path.exists(args.image):
         print(json.dumps({
             'success': False,
             'error': f'Image file not found: {args.image}'
         }))
         sys.exit(1)
     
-    # Get image metadata
-    metadata = get_image_metadata(args.image)
+    profiler = profiler_from_args(args, 'waste_analyzer',
+                                  import_modules=('requests', 'PIL'))
+    with profiler.session():
+        # Read the image once and share the bytes between metadata and analysis
+        with contextlib.ExitStack() as stack:
+            try:
+                if args.image is not None:
+                    with open(args.image, 'rb') as image_file:
+                        image_bytes = image_file.read()
+                else:
+                    image_bytes = stack.enter_context(open_image_buffer(args))
+            except Exception as e:
+                print(json.dumps({
+                    'success': False,
+                    'error': f'Failed to read image from {describe_source(args)}: {str(e)}'
+                }))
+                sys.exit(1)
     
-    # Analyze waste
-    result = analyze_waste_with_groq(args.image, args.api_key)
+            metadata, result = analyze(image_bytes, args.api_key)
     
-    # Add metadata to result
-    if result['success']:
-        result['image_metadata'] = metadata
-        result['image_path'] = args.image
+        # Add metadata to result
+        if result['success']:
+            result['image_metadata'] = metadata
+            result['image_path'] = describe_source(args)
     
-    # Output result
-    output_json = json.dumps(result, indent=2)
+        # Output result
+        output_json = json.dumps(result, indent=2)
     
-    if args.output:
-        try:
-            with open(args.output, 'w') as f:
-                f.write(output_json)
-            print(f"Analysis saved to: {args.output}")
-        except Exception as e:
-            print(f"Error saving output: {e}", file=sys.stderr)
+        if args.output:
+            try:
+                with open(args.output, 'w') as f:
+                    f.write(output_json)
+                print(f"Analysis saved to: {args.output}")
+            except Exception as e:
+                print(f"Error saving output: {e}", file=sys.stderr)
+                print(output_json)
+        else:
             print(output_json)
-    else:
-        print(output_json)
 
 if __name__ == '__main__':
     main() 
\ No newline at end of file
@@ -5,14 +5,15 @@ This script is called from the Node.js backend to classify waste in images.
 """
 
 import argparse
+import contextlib
 import json
 import sys
 import os
-from pathlib import Path
-from ultralytics import YOLO
-import cv2
-import numpy as np
-from PIL import Image
+
+from image_source import add_image_source_arguments, decode_image, describe_source, open_image_buffer
+from model_cache import load_fused_model
+from profiling import add_profile_arguments, from_args as profiler_from_args
+from tiling import add_tiling_arguments, should_tile, tiled_predict, tiling_options
 
 # Waste categories for classification
 WASTE_CATEGORIES = {
@@ -28,133 +29,251 @@ WASTE_CATEGORIES = {
 def load_model(model_path='yolov8n.pt'):
     """Load YOLOv8 model for waste classification."""
     try:
-        model = YOLO(model_path)
+        model = load_fused_model(model_path)
         return model
     except Exception as e:
         print(f"Error loading model: {e}", file=sys.stderr)
         return None
 
-def classify_waste(image_path, model):
+def classify_waste(image_path, model, profiler=None, tiling=None):
     """Classify waste in the given image."""
+    import cv2
+
+    # Load and preprocess image
+    image = cv2.imread(image_path)
+    return classify_image(image, model, profiler, source=image_path, tiling=tiling)
+
+def classify_waste_bytes(image_bytes, model, profiler=None, source='<buffer>', tiling=None):
+    """Classify waste in an encoded image held in memory (no temp file)."""
+    image = decode_image(image_bytes) if len(image_bytes) else None
+    return classify_image(image, model, profiler, source=source, tiling=tiling)
+
+def classify_image(image, model, profiler=None, source=None, tiling=None):
+    """Classify waste in an already decoded BGR image.
+
+    ``tiling`` (from tiling.tiling_options) enables tiled inference for
+    images large enough to need it.
+    """
+    return classify_images([image], model, profiler, sources=[source], tiling=tiling)[0]
+
+def classify_image_tiled(image, model, profiler, tiling):
+    """Classify a large image tile by tile, merging boxes across tile borders."""
     try:
-        # Load and preprocess image
-        image = cv2.imread(image_path)
+        boxes, scores, classes = tiled_predict(
+            image, model,
+            tile_size=tiling['tile_size'],
+            overlap=tiling['overlap'],
+            tile_batch=tiling['tile_batch'],
+            profiler=profiler
+        )
+        detections = [
+            make_detection(x1, y1, x2, y2, float(score), int(class_id))
+            for (x1, y1, x2, y2), score, class_id in zip(boxes, scores, classes)
+        ]
+        result = summarize_detections(detections)
+        height, width = image.shape[:2]
+        result['tiling'] = {
+            'tile_size': tiling['tile_size'],
+            'overlap': tiling['overlap'],
+            'image_size': {'width': width, 'height': height}
+        }
+        return result
+    except Exception as e:
+        return failed_classification(str(e))
+
+def classify_images(images, model, profiler=None, sources=None, tiling=None):
+    """Classify a list of decoded BGR images with one batched model call.
+
+    With ``tiling``, images large enough to need it are classified tile by
+    tile instead and their results carry a 'tiling' key.
+    """
+    if sources is None:
+        sources = [None] * len(images)
+    
+    outputs = [None] * len(images)
+    valid = []
+    for index, (image, source) in enumerate(zip(images, sources)):
         if image is None:
-            raise ValueError(f"Could not load image: {image_path}")
+            outputs[index] = failed_classification(f"Could not load image: {source}")
+        elif tiling is not None and should_tile(image, tiling['tile_size'], tiling['mode']):
+            outputs[index] = classify_image_tiled(image, model, profiler, tiling)
+        else:
+            valid.append(index)
+    
+    if not valid:
+        return outputs
+    
+    try:
+        batch = [images[index] for index in valid]
         
         # Run inference
-        results = model(image)
-        
-        # Process results
-        detections = []
-        for result in results:
-            boxes = result.boxes
-            if boxes is not None:
-                for box in boxes:
-                    # Get coordinates
-                    x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                    
-                    # Get confidence and class
-                    confidence = float(box.conf[0].cpu().numpy())
-                    class_id = int(box.cls[0].cpu().numpy())
-                    
-                    # Map class ID to waste category
-                    waste_type = WASTE_CATEGORIES.get(class_id, 'unknown')
-                    
-                    detection = {
-                        'type': waste_type,
-                        'confidence': round(confidence, 3),
-                        'bbox': {
-                            'x1': int(x1),
-                            'y1': int(y1),
-                            'x2': int(x2),
-                            'y2': int(y2)
-                        },
-                        'area': int((x2 - x1) * (y2 - y1))
-                    }
-                    detections.append(detection)
-        
-        # Sort by confidence
-        detections.sort(key=lambda x: x['confidence'], reverse=True)
-        
-        # Calculate summary statistics
-        waste_summary = {}
-        for detection in detections:
-            waste_type = detection['type']
-            if waste_type not in waste_summary:
-                waste_summary[waste_type] = {
-                    'count': 0,
-                    'total_confidence': 0,
-                    'total_area': 0
-                }
-            waste_summary[waste_type]['count'] += 1
-            waste_summary[waste_type]['total_confidence'] += detection['confidence']
-            waste_summary[waste_type]['total_area'] += detection['area']
-        
-        # Calculate averages
-        for waste_type in waste_summary:
-            count = waste_summary[waste_type]['count']
-            waste_summary[waste_type]['avg_confidence'] = round(
-                waste_summary[waste_type]['total_confidence'] / count, 3
-            )
-            waste_summary[waste_type]['avg_area'] = int(
-                waste_summary[waste_type]['total_area'] / count
-            )
+        if profiler is not None:
+            with profiler.torch_trace():
+                results = model(batch)
+        else:
+            results = model(batch)
         
-        return {
-            'success': True,
-            'detections': detections,
-            'summary': waste_summary,
-            'total_detections': len(detections)
-        }
+        for index, result in zip(valid, results):
+            outputs[index] = build_classification([result])
         
     except Exception as e:
-        return {
-            'success': False,
-            'error': str(e),
-            'detections': [],
-            'summary': {},
-            'total_detections': 0
-        }
+        for index in valid:
+            outputs[index] = failed_classification(str(e))
+    
+    return outputs
+
+def build_classification(results):
+    """Turn YOLOv8 results for one image into detections and a summary."""
+    # Process results
+    detections = []
+    for result in results:
+        boxes = result.boxes
+        if boxes is not None:
+            for box in boxes:
+                # Get coordinates
+                x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
+                
+                # Get confidence and class
+                confidence = float(box.conf[0].cpu().numpy())
+                class_id = int(box.cls[0].cpu().numpy())
+                
+                detections.append(make_detection(x1, y1, x2, y2, confidence, class_id))
+    
+    return summarize_detections(detections)
+
+def make_detection(x1, y1, x2, y2, confidence, class_id):
+    """Build one detection entry in full-image pixel coordinates."""
+    # Map class ID to waste category
+    waste_type = WASTE_CATEGORIES.get(class_id, 'unknown')
+    
+    return {
+        'type': waste_type,
+        'confidence': round(confidence, 3),
+        'bbox': {
+            'x1': int(x1),
+            'y1': int(y1),
+            'x2': int(x2),
+            'y2': int(y2)
+        },
+        'area': int((x2 - x1) * (y2 - y1))
+    }
+
+def summarize_detections(detections):
+    """Sort detections and compute per-type summary statistics."""
+    # Sort by confidence
+    detections.sort(key=lambda x: x['confidence'], reverse=True)
+    
+    # Calculate summary statistics
+    waste_summary = {}
+    for detection in detections:
+        waste_type = detection['type']
+        if waste_type not in waste_summary:
+            waste_summary[waste_type] = {
+                'count': 0,
+                'total_confidence': 0,
+                'total_area': 0
+            }
+        waste_summary[waste_type]['count'] += 1
+        waste_summary[waste_type]['total_confidence'] += detection['confidence']
+        waste_summary[waste_type]['total_area'] += detection['area']
+    
+    # Calculate averages
+    for waste_type in waste_summary:
+        count = waste_summary[waste_type]['count']
+        waste_summary[waste_type]['avg_confidence'] = round(
+            waste_summary[waste_type]['total_confidence'] / count, 3
+        )
+        waste_summary[waste_type]['avg_area'] = int(
+            waste_summary[waste_type]['total_area'] / count
+        )
+    
+    return {
+        'success': True,
+        'detections': detections,
+        'summary': waste_summary,
+        'total_detections': len(detections)
+    }
+
+def failed_classification(error):
+    """Result for an image that could not be classified."""
+    return {
+        'success': False,
+        'error': error,
+        'detections': [],
+        'summary': {},
+        'total_detections': 0
+    }
+
+def apply_confidence_threshold(result, threshold):
+    """Drop detections below the confidence threshold."""
+    if result['success']:
+        result['detections'] = [
+            d for d in result['detections'] 
+            if d['confidence'] >= threshold
+        ]
+        result['total_detections'] = len(result['detections'])
+    return result
 
 def main():
     parser = argparse.ArgumentParser(description='Waste Classification using YOLOv8')
-    parser.add_argument('--image', required=True, help='Path to input image')
+    add_image_source_arguments(parser)
     parser.add_argument('--model', default='yolov8n.pt', help='Path to YOLOv8 model')
     parser.add_argument('--confidence', type=float, default=0.5, help='Confidence threshold')
+    add_tiling_arguments(parser)
+    add_profile_arguments(parser)
     
     args = parser.parse_args()
     
-    # Check if image exists
-    if not os.path.exists(args.image):
+    try:
+        tiling = tiling_options(args)
+    except ValueError as e:
         print(json.dumps({
             'success': False,
-            'error': f'Image file not found: {args.image}'
+            'error': f'Invalid tiling options: {str(e)}'
         }))
         sys.exit(1)
     
-    # Load model
-    model = load_model(args.model)
-    if model is None:
+    # Check if image exists
+    if args.image is not None and not os.path.exists(args.image):
         print(json.dumps({
             'success': False,
-            'error': 'Failed to load YOLOv8 model'
+            'error': f'Image file not found: {args.image}'
         }))
         sys.exit(1)
     
-    # Classify waste
-    result = classify_waste(args.image, model)
+    profiler = profiler_from_args(args, 'waste_classifier',
+                                  import_modules=('ultralytics', 'cv2', 'numpy'))
+    with profiler.session():
+        # Load model
+        model = load_model(args.model)
+        if model is None:
+            print(json.dumps({
+                'success': False,
+                'error': 'Failed to load YOLOv8 model'
+            }))
+            sys.exit(1)
     
-    # Filter by confidence threshold
-    if result['success']:
-        result['detections'] = [
-            d for d in result['detections'] 
-            if d['confidence'] >= args.confidence
-        ]
-        result['total_detections'] = len(result['detections'])
+        # Classify waste
+        if args.image is not None:
+            result = classify_waste(args.image, model, profiler, tiling=tiling)
+        else:
+            with contextlib.ExitStack() as stack:
+                try:
+                    image_bytes = stack.enter_context(open_image_buffer(args))
+                except Exception as e:
+                    print(json.dumps({
+                        'success': False,
+                        'error': f'Failed to read image from {describe_source(args)}: {str(e)}'
+                    }))
+                    sys.exit(1)
+                result = classify_waste_bytes(image_bytes, model, profiler,
+                                              source=describe_source(args), tiling=tiling)
+    
+        # Filter by confidence threshold
+        apply_confidence_threshold(result, args.confidence)
     
-    # Output JSON result
-    print(json.dumps(result, indent=2))
+        # Output JSON result
+        print(json.dumps(result, indent=2))
 
 if __name__ == '__main__':
     main() 
\ No newline at end of file
@@ -0,0 +1,459 @@
+#!/usr/bin/env python3
+"""
+Distributed Waste Classification Work Queue
+Jobs (an image path or the image bytes, plus options) are stored in a SQLite
+database that any number of worker processes, on any host that can reach the
+file, claim from with time-limited leases. A worker that dies simply lets its
+leases expire and the jobs are claimed again by someone else.
+
+The database can live on shared storage, but that filesystem must support
+POSIX byte-range locks (SQLite's default rollback journal is used rather than
+WAL for this reason), and hosts' clocks should agree to well within the lease
+length.
+
+Usage:
+    work_queue.py enqueue --images '["uploads/a.jpg", ...]' [--blob] [--tiled auto]
+    work_queue.py worker [--batch-size 16] [--exit-when-empty]
+    work_queue.py status
+    work_queue.py results [--since-id N]
+"""
+
+import argparse
+import json
+import os
+import signal
+import socket
+import sqlite3
+import sys
+import threading
+import time
+
+from profiling import add_profile_arguments, from_args as profiler_from_args
+from tiling import add_tiling_arguments, tiling_options
+
+DEFAULT_DB = 'work_queue.db'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    image TEXT NOT NULL,
+    image_blob BLOB,
+    options TEXT NOT NULL DEFAULT '{}',
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_expires REAL,
+    enqueued_at REAL NOT NULL,
+    finished_at REAL,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_by_state ON jobs (state, lease_expires);
+"""
+
+
+class WorkQueue:
+    """Lease-based job queue on a SQLite database file."""
+
+    def __init__(self, path=DEFAULT_DB, timeout=30.0):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers can
+        # never select the same rows and both mark them leased
+        return _Transaction(self.conn)
+
+    def enqueue(self, images, options=None, blobs=None):
+        """Add one job per image; returns the new job ids."""
+        now = time.time()
+        options_json = json.dumps(options or {})
+        ids = []
+        with self._transaction():
+            for index, image in enumerate(images):
+                blob = blobs[index] if blobs is not None else None
+                cursor = self.conn.execute(
+                    'INSERT INTO jobs (image, image_blob, options, enqueued_at) VALUES (?, ?, ?, ?)',
+                    (image, blob, options_json, now)
+                )
+                ids.append(cursor.lastrowid)
+        return ids
+
+    def claim(self, worker, limit, lease_seconds, max_attempts):
+        """Lease up to limit pending (or lease-expired) jobs to this worker."""
+        now = time.time()
+        with self._transaction():
+            # Jobs that keep killing their workers are parked instead of retried forever
+            self.conn.execute(
+                "UPDATE jobs SET state = 'failed', finished_at = ?, "
+                "error = COALESCE(error, 'Lease expired too many times') "
+                "WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?",
+                (now, now, max_attempts)
+            )
+            rows = self.conn.execute(
+                "SELECT id, image, image_blob, options, attempts FROM jobs "
+                "WHERE state = 'pending' OR (state = 'leased' AND lease_expires < ?) "
+                "ORDER BY id LIMIT ?",
+                (now, limit)
+            ).fetchall()
+            if rows:
+                self.conn.executemany(
+                    "UPDATE jobs SET state = 'leased', worker = ?, lease_expires = ?, "
+                    "attempts = attempts + 1 WHERE id = ?",
+                    [(worker, now + lease_seconds, row['id']) for row in rows]
+                )
+        return [
+            {
+                'id': row['id'],
+                'image': row['image'],
+                'blob': row['image_blob'],
+                'options': json.loads(row['options']),
+                'attempt': row['attempts'] + 1
+            }
+            for row in rows
+        ]
+
+    def renew(self, worker, job_ids, lease_seconds):
+        """Extend this worker's leases; returns the ids it still holds."""
+        expires = time.time() + lease_seconds
+        held = []
+        with self._transaction():
+            for job_id in job_ids:
+                cursor = self.conn.execute(
+                    "UPDATE jobs SET lease_expires = ? WHERE id = ? AND worker = ? AND state = 'leased'",
+                    (expires, job_id, worker)
+                )
+                if cursor.rowcount:
+                    held.append(job_id)
+        return held
+
+    def complete(self, worker, job_id, result):
+        """Store a result; ignored if the lease was lost to another worker."""
+        with self._transaction():
+            cursor = self.conn.execute(
+                "UPDATE jobs SET state = 'done', result = ?, error = NULL, finished_at = ?, "
+                "image_blob = NULL, lease_expires = NULL "
+                "WHERE id = ? AND worker = ? AND state = 'leased'",
+                (json.dumps(result), time.time(), job_id, worker)
+            )
+        return cursor.rowcount == 1
+
+    def release(self, worker, job_id, error, max_attempts):
+        """Give a job back after a failure; it is retried until max_attempts."""
+        with self._transaction():
+            self.conn.execute(
+                "UPDATE jobs SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "error = ?, lease_expires = NULL, "
+                "finished_at = CASE WHEN attempts >= ? THEN ? ELSE NULL END "
+                "WHERE id = ? AND worker = ? AND state = 'leased'",
+                (max_attempts, error, max_attempts, time.time(), job_id, worker)
+            )
+
+    def status(self):
+        now = time.time()
+        counts = {'pending': 0, 'leased': 0, 'expired': 0, 'done': 0, 'failed': 0}
+        for row in self.conn.execute(
+            "SELECT CASE WHEN state = 'leased' AND lease_expires < ? THEN 'expired' ELSE state END AS s, "
+            "COUNT(*) AS n FROM jobs GROUP BY s",
+            (now,)
+        ):
+            counts[row['s']] = row['n']
+        return counts
+
+    def results(self, since_id=0, limit=1000):
+        rows = self.conn.execute(
+            "SELECT id, image, state, attempts, worker, result, error FROM jobs "
+            "WHERE id > ? AND state IN ('done', 'failed') ORDER BY id LIMIT ?",
+            (since_id, limit)
+        ).fetchall()
+        return [
+            {
+                'id': row['id'],
+                'image': row['image'],
+                'state': row['state'],
+                'attempts': row['attempts'],
+                'worker': row['worker'],
+                'result': json.loads(row['result']) if row['result'] else None,
+                'error': row['error']
+            }
+            for row in rows
+        ]
+
+
+class _Transaction:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+        return False
+
+
+class LeaseHeartbeat:
+    """Renews a worker's leases from a background thread while a batch runs.
+
+    Without it a batch that outlives --lease-seconds would be claimed again
+    by another worker while this one is still working on it.
+    """
+
+    def __init__(self, path, worker, job_ids, lease_seconds):
+        self.path = path
+        self.worker = worker
+        self.job_ids = list(job_ids)
+        self.lease_seconds = lease_seconds
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='lease-heartbeat', daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+    def _run(self):
+        queue = None
+        try:
+            while self.job_ids and not self._stop.wait(self.lease_seconds / 3):
+                try:
+                    # SQLite connections cannot be shared with the worker thread
+                    if queue is None:
+                        queue = WorkQueue(self.path)
+                    held = queue.renew(self.worker, self.job_ids, self.lease_seconds)
+                except sqlite3.Error as e:
+                    print(f"Lease renewal failed: {e}", file=sys.stderr)
+                    continue
+                if len(held) < len(self.job_ids):
+                    print(f"Lost {len(self.job_ids) - len(held)} leases to other workers",
+                          file=sys.stderr)
+                self.job_ids = held
+        finally:
+            if queue is not None:
+                queue.close()
+
+
+def process_claimed(jobs, model, profiler):
+    """Classify a claimed batch.
+
+    Returns one result per job, plus one flag per job that is True if the
+    image is present but cannot be decoded. A file missing on this host is
+    not flagged, since another worker may be able to see it.
+    """
+    import cv2
+    from image_source import decode_image
+    from waste_classifier import apply_confidence_threshold, classify_images
+
+    images = []
+    undecodable = []
+    for job in jobs:
+        if job['blob'] is not None:
+            image = decode_image(job['blob']) if job['blob'] else None
+            undecodable.append(image is None)
+        elif os.path.exists(job['image']):
+            image = cv2.imread(job['image'])
+            undecodable.append(image is None)
+        else:
+            image = None
+            undecodable.append(False)
+        images.append(image)
+
+    # Tiling is a per-job option, so classify each set of options as its own batch
+    groups = {}
+    for index, job in enumerate(jobs):
+        key = json.dumps(job['options'].get('tiling'), sort_keys=True)
+        groups.setdefault(key, []).append(index)
+
+    results = [None] * len(jobs)
+    for key, indices in groups.items():
+        group_results = classify_images([images[index] for index in indices], model, profiler,
+                                        sources=[jobs[index]['image'] for index in indices],
+                                        tiling=json.loads(key))
+        for index, result in zip(indices, group_results):
+            results[index] = result
+
+    for job, result in zip(jobs, results):
+        apply_confidence_threshold(result, job['options'].get('confidence', 0.5))
+    return results, undecodable
+
+
+def run_worker(args, queue):
+    from waste_classifier import load_model
+
+    worker = args.worker_id or f'{socket.gethostname()}:{os.getpid()}'
+    stop_requested = []
+
+    def request_stop(signum, frame):
+        # Finish the current batch so its leases are not left to expire
+        stop_requested.append(signum)
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    profiler = profiler_from_args(args, 'work_queue_worker',
+                                  import_modules=('ultralytics', 'cv2', 'numpy'))
+    totals = {'batches': 0, 'completed': 0, 'failed': 0, 'retried': 0, 'lost_leases': 0}
+
+    with profiler.session():
+        model = load_model(args.model)
+        if model is None:
+            return {
+                'success': False,
+                'error': 'Failed to load YOLOv8 model',
+                'worker': worker
+            }
+
+        while not stop_requested:
+            jobs = queue.claim(worker, args.batch_size, args.lease_seconds, args.max_attempts)
+            if not jobs:
+                if args.exit_when_empty:
+                    break
+                time.sleep(args.poll_interval)
+                continue
+
+            totals['batches'] += 1
+            heartbeat = LeaseHeartbeat(queue.path, worker, [job['id'] for job in jobs],
+                                       args.lease_seconds)
+            with profiler.sample('batch'), heartbeat:
+                try:
+                    results, undecodable = process_claimed(jobs, model, profiler)
+                except Exception as e:
+                    for job in jobs:
+                        queue.release(worker, job['id'], f'Batch failed: {str(e)}', args.max_attempts)
+                    totals['retried'] += len(jobs)
+                    continue
+
+            for job, result, cannot_decode in zip(jobs, results, undecodable):
+                if cannot_decode:
+                    # Corrupt images will not get better on retry
+                    queue.release(worker, job['id'], result.get('error'), 0)
+                    totals['failed'] += 1
+                elif not result['success']:
+                    # Missing files and inference errors (e.g. out of memory)
+                    # may succeed on another host or a later attempt
+                    queue.release(worker, job['id'], result.get('error'), args.max_attempts)
+                    totals['retried'] += 1
+                elif queue.complete(worker, job['id'], result):
+                    totals['completed'] += 1
+                else:
+                    totals['lost_leases'] += 1
+
+    return {
+        'success': True,
+        'worker': worker,
+        'interrupted': bool(stop_requested),
+        **totals
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Distributed Waste Classification Work Queue')
+    parser.add_argument('--db', default=os.getenv('WORK_QUEUE_DB', DEFAULT_DB),
+                        help='Path to the shared SQLite queue database')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    enqueue = subparsers.add_parser('enqueue', help='Add classification jobs')
+    enqueue.add_argument('--images', required=True, help='JSON array of image paths')
+    enqueue.add_argument('--blob', action='store_true',
+                         help='Store the image bytes in the queue instead of the path')
+    enqueue.add_argument('--confidence', type=float, default=0.5, help='Confidence threshold')
+    add_tiling_arguments(enqueue)
+
+    worker = subparsers.add_parser('worker', help='Claim and process jobs')
+    worker.add_argument('--model', default='yolov8n.pt', help='Path to YOLOv8 model')
+    worker.add_argument('--batch-size', type=int, default=16, help='Jobs claimed per batch')
+    worker.add_argument('--lease-seconds', type=float, default=300,
+                        help='How long a claimed job is reserved before others may take it')
+    worker.add_argument('--max-attempts', type=int, default=3,
+                        help='Claims allowed per job before it is marked failed')
+    worker.add_argument('--poll-interval', type=float, default=2.0,
+                        help='Seconds to wait when the queue is empty')
+    worker.add_argument('--exit-when-empty', action='store_true', help='Exit once no jobs are claimable')
+    worker.add_argument('--worker-id', help='Worker name recorded on leases (default host:pid)')
+    add_profile_arguments(worker, sampling=True)
+
+    subparsers.add_parser('status', help='Show job counts by state')
+
+    results = subparsers.add_parser('results', help='Print finished jobs')
+    results.add_argument('--since-id', type=int, default=0, help='Only jobs with a larger id')
+    results.add_argument('--limit', type=int, default=1000, help='Maximum jobs to print')
+
+    args = parser.parse_args()
+
+    if args.command == 'enqueue':
+        try:
+            image_paths = json.loads(args.images)
+            if not isinstance(image_paths, list) or not image_paths:
+                raise ValueError('Images argument must be a non-empty JSON array')
+        except (json.JSONDecodeError, ValueError) as e:
+            print(json.dumps({
+                'success': False,
+                'error': f'Invalid images argument: {str(e)}'
+            }))
+            sys.exit(1)
+
+        try:
+            tiling = tiling_options(args)
+        except ValueError as e:
+            print(json.dumps({
+                'success': False,
+                'error': f'Invalid tiling options: {str(e)}'
+            }))
+            sys.exit(1)
+
+        blobs = None
+        if args.blob:
+            missing = [p for p in image_paths if not os.path.isfile(p)]
+            if missing:
+                print(json.dumps({
+                    'success': False,
+                    'error': f'Image file not found: {missing[0]}'
+                }))
+                sys.exit(1)
+            blobs = []
+            for image_path in image_paths:
+                with open(image_path, 'rb') as f:
+                    blobs.append(f.read())
+
+    if args.command == 'worker' and args.batch_size < 1:
+        print(json.dumps({
+            'success': False,
+            'error': 'Batch size must be at least 1'
+        }))
+        sys.exit(1)
+
+    queue = WorkQueue(args.db)
+    try:
+        if args.command == 'enqueue':
+            if blobs is None:
+                # Relative paths would be resolved against each worker's cwd
+                image_paths = [os.path.abspath(p) for p in image_paths]
+            job_ids = queue.enqueue(image_paths, {'confidence': args.confidence, 'tiling': tiling}, blobs)
+            result = {'success': True, 'job_ids': job_ids}
+        elif args.command == 'worker':
+            result = run_worker(args, queue)
+        elif args.command == 'status':
+            result = {'success': True, 'jobs': queue.status()}
+        else:
+            result = {'success': True, 'results': queue.results(args.since_id, args.limit)}
+    finally:
+        queue.close()
+
+    # Output JSON result
+    print(json.dumps(result, indent=2))
+    if not result['success']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
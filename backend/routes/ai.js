@@ -5,82 +5,191 @@ const path = require('path');
 const router = express.Router();
 
 // Multer configuration for AI model input
-const storage = multer.diskStorage({
-  destination: (req, file, cb) => {
-    cb(null, 'ai-inputs/');
-  },
-  filename: (req, file, cb) => {
-    const uniqueSuffix = Date.now() + '-' + Math.round(Math.random() * 1E9);
-    cb(null, 'input-' + uniqueSuffix + '.' + file.originalname.split('.').pop());
+const uploadLimits = {
+  fileSize: 20 * 1024 * 1024 // 20MB limit for images/videos
+};
+
+const fileFilter = (req, file, cb) => {
+  const allowedTypes = ['image/jpeg', 'image/png', 'image/jpg', 'video/mp4', 'video/avi'];
+  if (allowedTypes.includes(file.mimetype)) {
+    cb(null, true);
+  } else {
+    cb(new Error('Only image and video files are allowed!'), false);
   }
+};
+
+// Uploads stay in memory and are handed to Python over stdin
+const memoryUpload = multer({
+  storage: multer.memoryStorage(),
+  limits: uploadLimits,
+  fileFilter: fileFilter
 });
 
-const upload = multer({ 
-  storage: storage,
-  limits: {
-    fileSize: 20 * 1024 * 1024 // 20MB limit for images/videos
-  },
-  fileFilter: (req, file, cb) => {
-    const allowedTypes = ['image/jpeg', 'image/png', 'image/jpg', 'video/mp4', 'video/avi'];
-    if (allowedTypes.includes(file.mimetype)) {
-      cb(null, true);
-    } else {
-      cb(new Error('Only image and video files are allowed!'), false);
-    }
+// Frame a buffer as a 4-byte big-endian length followed by the payload
+const writeFrame = (stream, buffer) => {
+  const header = Buffer.alloc(4);
+  header.writeUInt32BE(buffer.length, 0);
+  stream.write(header);
+  stream.write(buffer);
+};
+
+// Long-running classification server; requests are scheduled by priority
+// so interactive classifications can overtake queued bulk batches
+let inferenceServer = null;
+const pendingInferences = new Map();
+let nextInferenceId = 1;
+
+// Respawn delay after the server exits; doubles while it keeps failing
+const INFERENCE_RESPAWN_BASE_MS = 2000;
+const INFERENCE_RESPAWN_MAX_MS = 60000;
+let inferenceRespawnMs = INFERENCE_RESPAWN_BASE_MS;
+
+const getInferenceServer = () => {
+  if (inferenceServer) {
+    return inferenceServer;
+  }
+
+  // The server picks a model size per request from queue depth and latency.
+  // Models are loaded at startup so no request waits for one to load.
+  const serverArgs = [
+    path.join(__dirname, '../ml_models/inference_server.py'),
+    '--models', process.env.YOLO_MODELS || 'yolov8n.pt,yolov8s.pt,yolov8m.pt',
+    '--preload'
+  ];
+  if (process.env.YOLO_LATENCY_TARGET_MS) {
+    serverArgs.push('--latency-target-ms', process.env.YOLO_LATENCY_TARGET_MS);
+  }
+  if (process.env.YOLO_BULK_LATENCY_TARGET_MS) {
+    serverArgs.push('--bulk-latency-target-ms', process.env.YOLO_BULK_LATENCY_TARGET_MS);
+  }
+  if (process.env.YOLO_TILE_SIZE) {
+    serverArgs.push('--tile-size', process.env.YOLO_TILE_SIZE);
   }
+  if (process.env.YOLO_TILE_OVERLAP) {
+    serverArgs.push('--tile-overlap', process.env.YOLO_TILE_OVERLAP);
+  }
+
+  const child = spawn('python', serverArgs);
+
+  let buffered = '';
+  child.stdout.on('data', (data) => {
+    buffered += data.toString();
+    let newline;
+    while ((newline = buffered.indexOf('\n')) !== -1) {
+      const line = buffered.slice(0, newline);
+      buffered = buffered.slice(newline + 1);
+      if (!line.trim()) {
+        continue;
+      }
+
+      let message;
+      try {
+        message = JSON.parse(line);
+      } catch (parseError) {
+        console.error('Error parsing inference server output:', line);
+        continue;
+      }
+
+      if (message.success) {
+        inferenceRespawnMs = INFERENCE_RESPAWN_BASE_MS;
+      }
+
+      const pending = pendingInferences.get(message.id);
+      if (pending) {
+        pendingInferences.delete(message.id);
+        pending.resolve(message);
+      }
+    }
+  });
+
+  child.stderr.on('data', (data) => {
+    console.error('Inference server:', data.toString());
+  });
+
+  child.stdin.on('error', (error) => {
+    console.error('Inference server stdin error:', error.message);
+  });
+
+  child.on('close', (code) => {
+    inferenceServer = null;
+    for (const pending of pendingInferences.values()) {
+      pending.reject(new Error(`Inference server exited with code ${code}`));
+    }
+    pendingInferences.clear();
+
+    // Restart in the background so the next request does not wait for models to load
+    setTimeout(() => {
+      if (!inferenceServer) {
+        getInferenceServer();
+      }
+    }, inferenceRespawnMs);
+    inferenceRespawnMs = Math.min(inferenceRespawnMs * 2, INFERENCE_RESPAWN_MAX_MS);
+  });
+
+  inferenceServer = child;
+  return child;
+};
+
+// Start loading models now rather than on the first classification request
+getInferenceServer();
+
+// Tiled inference splits large drone and panorama shots into model-sized tiles
+const TILING_MODES = ['off', 'auto', 'on'];
+
+// Tiling mode for a request: the "tiled" form field, else YOLO_TILED, else off
+const getTilingMode = (req) => req.body.tiled || process.env.YOLO_TILED || 'off';
+
+// Send uploaded files to the inference server; resolves with its JSON response
+const runInference = (priority, files, tiled = 'off') => new Promise((resolve, reject) => {
+  const server = getInferenceServer();
+  const id = String(nextInferenceId++);
+  pendingInferences.set(id, { resolve, reject });
+
+  const header = {
+    id: id,
+    priority: priority,
+    tiled: tiled,
+    images: files.map(file => file.originalname)
+  };
+  writeFrame(server.stdin, Buffer.from(JSON.stringify(header)));
+  files.forEach(file => writeFrame(server.stdin, file.buffer));
 });
 
 // Waste classification using YOLOv8
-router.post('/classify-waste', upload.single('image'), async (req, res) => {
+router.post('/classify-waste', memoryUpload.single('image'), async (req, res) => {
   try {
     if (!req.file) {
       return res.status(400).json({ error: 'Image file is required' });
     }
 
-    const imagePath = req.file.path;
-    const imageName = req.file.filename;
+    const tiled = getTilingMode(req);
+    if (!TILING_MODES.includes(tiled)) {
+      return res.status(400).json({ error: `tiled must be one of: ${TILING_MODES.join(', ')}` });
+    }
 
-    // Call Python script for YOLOv8 classification
-    const pythonProcess = spawn('python', [
-      path.join(__dirname, '../ml_models/waste_classifier.py'),
-      '--image', imagePath,
-      '--model', 'yolov8n.pt'
-    ]);
+    const imageName = req.file.originalname;
 
-    let result = '';
-    let error = '';
-
-    pythonProcess.stdout.on('data', (data) => {
-      result += data.toString();
-    });
+    // Field classifications run in the interactive priority class
+    const response = await runInference('interactive', [req.file], tiled);
 
-    pythonProcess.stderr.on('data', (data) => {
-      error += data.toString();
-    });
+    if (response.rejected) {
+      return res.status(503).json({
+        error: 'Classification queue is full, please retry',
+        details: response.error
+      });
+    }
 
-    pythonProcess.on('close', (code) => {
-      if (code !== 0) {
-        console.error('Python process error:', error);
-        return res.status(500).json({ 
-          error: 'Failed to classify waste',
-          details: error
-        });
-      }
+    if (!response.success) {
+      return res.status(500).json({
+        error: 'Failed to classify waste',
+        details: response.error
+      });
+    }
 
-      try {
-        const classificationResult = JSON.parse(result);
-        res.json({
-          message: 'Waste classification completed',
-          image: imageName,
-          results: classificationResult
-        });
-      } catch (parseError) {
-        console.error('Error parsing Python output:', parseError);
-        res.status(500).json({ 
-          error: 'Failed to parse classification results',
-          rawOutput: result
-        });
-      }
+    res.json({
+      message: 'Waste classification completed',
+      image: imageName,
+      results: response.batch_results[0]
     });
 
   } catch (error) {
@@ -90,21 +199,24 @@ router.post('/classify-waste', upload.single('image'), async (req, res) => {
 });
 
 // Waste analysis using Groq API
-router.post('/analyze-waste', upload.single('image'), async (req, res) => {
+router.post('/analyze-waste', memoryUpload.single('image'), async (req, res) => {
   try {
     if (!req.file) {
       return res.status(400).json({ error: 'Image file is required' });
     }
 
-    const imagePath = req.file.path;
-    const imageName = req.file.filename;
+    const imageName = req.file.originalname;
 
     // Call Python script for Groq API analysis
     const pythonProcess = spawn('python', [
       path.join(__dirname, '../ml_models/waste_analyzer.py'),
-      '--image', imagePath,
+      '--image-stdin',
       '--api-key', process.env.GROQ_API_KEY || ''
     ]);
+    // EPIPE if Python exits before reading stdin; the close handler reports it
+    pythonProcess.stdin.on('error', () => {});
+    writeFrame(pythonProcess.stdin, req.file.buffer);
+    pythonProcess.stdin.end();
 
     let result = '';
     let error = '';
@@ -149,56 +261,41 @@ router.post('/analyze-waste', upload.single('image'), async (req, res) => {
 });
 
 // Batch processing for multiple images
-router.post('/batch-classify', upload.array('images', 10), async (req, res) => {
+router.post('/batch-classify', memoryUpload.array('images', 10), async (req, res) => {
   try {
     if (!req.files || req.files.length === 0) {
       return res.status(400).json({ error: 'At least one image is required' });
     }
 
-    const imagePaths = req.files.map(file => file.path);
-    const imageNames = req.files.map(file => file.filename);
-
-    // Call Python script for batch processing
-    const pythonProcess = spawn('python', [
-      path.join(__dirname, '../ml_models/batch_classifier.py'),
-      '--images', JSON.stringify(imagePaths),
-      '--model', 'yolov8n.pt'
-    ]);
+    const tiled = getTilingMode(req);
+    if (!TILING_MODES.includes(tiled)) {
+      return res.status(400).json({ error: `tiled must be one of: ${TILING_MODES.join(', ')}` });
+    }
 
-    let result = '';
-    let error = '';
+    const imageNames = req.files.map(file => file.originalname);
 
-    pythonProcess.stdout.on('data', (data) => {
-      result += data.toString();
-    });
+    // Batches run in the bulk priority class, one mini-batch at a time
+    const response = await runInference('bulk', req.files, tiled);
 
-    pythonProcess.stderr.on('data', (data) => {
-      error += data.toString();
-    });
+    if (response.rejected) {
+      return res.status(503).json({
+        error: 'Batch queue is full, please retry',
+        details: response.error
+      });
+    }
 
-    pythonProcess.on('close', (code) => {
-      if (code !== 0) {
-        console.error('Python process error:', error);
-        return res.status(500).json({ 
-          error: 'Failed to process batch',
-          details: error
-        });
-      }
+    if (!response.success) {
+      return res.status(500).json({
+        error: 'Failed to process batch',
+        details: response.error
+      });
+    }
 
-      try {
-        const batchResults = JSON.parse(result);
-        res.json({
-          message: 'Batch classification completed',
-          images: imageNames,
-          results: batchResults
-        });
-      } catch (parseError) {
-        console.error('Error parsing Python output:', parseError);
-        res.status(500).json({ 
-          error: 'Failed to parse batch results',
-          rawOutput: result
-        });
-      }
+    const { id, ...batchResults } = response;
+    res.json({
+      message: 'Batch classification completed',
+      images: imageNames,
+      results: batchResults
     });
 
   } catch (error) {